@@ -6,7 +6,13 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 import db
+import drivers
 import views
+import core.executor
+import core.gc
+import core.health
+import core.pack
+import core.replication
 from views.files import router as files_router
 from views.storage import router as storage_router
 from views.chunk import router as chunk_router
@@ -16,11 +22,21 @@ from views.user import router as user_router
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await db.init_db()
+    db.start_cfg_watcher()
+    core.gc.collector.start()
+    core.health.monitor.start()
     app.include_router(files_router)
     app.include_router(storage_router)
     app.include_router(chunk_router)
     app.include_router(user_router)
     yield
+    await db.stop_cfg_watcher()
+    await core.gc.collector.stop()
+    await core.health.monitor.stop()
+    await core.pack.drain()
+    await core.replication.drain()
+    await drivers.registry.close()
+    core.executor.cpu.shutdown()
     await db.Tortoise.close_connections()
 
 
@@ -40,6 +56,13 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     return views.Response(msg=exc.detail, code=exc.status_code)
 
 
+@app.exception_handler(core.replication.ReplicationError)
+async def replication_exception_handler(
+    request: Request, exc: core.replication.ReplicationError
+):
+    return views.Response(msg=str(exc), code=500)
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     return views.Response(data=exc.errors(), msg="Request is Invalid", code=400)
@@ -0,0 +1,100 @@
+"""
+定长分块与内容定义分块（FastCDC）的吞吐量和去重率对比。
+
+    python benchmarks/chunking.py                      # 合成语料
+    python benchmarks/chunking.py ~/vm-images ~/logs   # 真实语料（文件或目录）
+"""
+
+import os
+import random
+import sys
+import time
+
+import click
+import xxhash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.chunker import FastCDC  # noqa: E402
+
+
+def fixed_cut_points(data: bytes, size: int):
+    return list(range(size, len(data), size)) + [len(data)]
+
+
+def synthetic_corpus(size_mb: int, versions: int, edits: int, seed: int):
+    """随机基础数据及其若干个版本，每个版本在随机位置插入或删除少量字节"""
+    rng = random.Random(seed)
+    data = bytearray(rng.randbytes(size_mb * 1024 * 1024))
+    corpus = [bytes(data)]
+    for _ in range(versions):
+        for _ in range(edits):
+            pos = rng.randrange(len(data))
+            if rng.random() < 0.5:
+                data[pos:pos] = rng.randbytes(rng.randint(1, 64))
+            else:
+                del data[pos : pos + rng.randint(1, 64)]
+        corpus.append(bytes(data))
+    return corpus
+
+
+def real_corpus(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    with open(os.path.join(root, name), "rb") as f:
+                        yield f.read()
+        else:
+            with open(path, "rb") as f:
+                yield f.read()
+
+
+def run(name, corpus, cut_points):
+    total = 0
+    unique = {}
+    elapsed = 0.0
+    for data in corpus:
+        start = time.perf_counter()
+        prev = 0
+        for cut in cut_points(data):
+            chunk = data[prev:cut]
+            unique.setdefault(xxhash.xxh3_128_hexdigest(chunk), len(chunk))
+            prev = cut
+        elapsed += time.perf_counter() - start
+        total += len(data)
+    stored = sum(unique.values())
+    click.echo(
+        f"{name:<8} {total / elapsed / 1024 / 1024:>10.1f} MB/s "
+        f"{len(unique):>8} chunks {stored / 1024 / 1024:>10.1f} MiB stored "
+        f"{total / max(stored, 1):>8.2f}x dedup"
+    )
+
+
+@click.command()
+@click.argument("paths", nargs=-1, type=click.Path(exists=True))
+@click.option(
+    "--avg-size", default=1024 * 1024, help="平均分块大小（定长分块的块大小）"
+)
+@click.option("--size-mb", default=64, help="合成语料基础数据大小 (MiB)")
+@click.option("--versions", default=8, help="合成语料版本数")
+@click.option("--edits", default=16, help="每个版本的编辑次数")
+@click.option("--seed", default=0)
+def main(paths, avg_size, size_mb, versions, edits, seed):
+    cdc = FastCDC(avg_size // 4, avg_size, avg_size * 4)
+
+    if paths:
+        click.echo(f"real corpus: {', '.join(paths)}")
+        corpus = list(real_corpus(paths))
+    else:
+        click.echo(
+            f"synthetic corpus: {size_mb} MiB x {versions + 1} versions, {edits} edits each"
+        )
+        corpus = synthetic_corpus(size_mb, versions, edits, seed)
+
+    run("fixed", corpus, lambda data: fixed_cut_points(data, avg_size))
+    run("cdc", corpus, lambda data: cdc.cut_points(data, True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Reed–Solomon 纠删码的单核编码/解码吞吐量，以及与多副本相比的存储开销。
+
+    python benchmarks/erasure.py
+    python benchmarks/erasure.py -k 6 -m 3 --chunk-size 4194304
+"""
+
+import os
+import random
+import sys
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.erasure import ReedSolomon  # noqa: E402
+
+
+def measure(total: int, func, chunks):
+    start = time.perf_counter()
+    for chunk in chunks:
+        func(chunk)
+    return total / (time.perf_counter() - start) / 1024 / 1024
+
+
+@click.command()
+@click.option("-k", "--data-shards", default=4, help="数据分片数")
+@click.option("-m", "--parity-shards", default=2, help="校验分片数")
+@click.option("--chunk-size", default=1024 * 1024, help="分块大小")
+@click.option("--size-mb", default=256, help="测试数据总量 (MiB)")
+@click.option("--replicas", default=3, help="对比的副本数")
+@click.option("--seed", default=0)
+def main(data_shards, parity_shards, chunk_size, size_mb, replicas, seed):
+    rng = random.Random(seed)
+    codec = ReedSolomon(data_shards, parity_shards)
+    chunks = [
+        rng.randbytes(chunk_size) for _ in range(size_mb * 1024 * 1024 // chunk_size)
+    ]
+    total = len(chunks) * chunk_size
+    click.echo(
+        f"RS({data_shards}+{parity_shards}), {len(chunks)} x {chunk_size} byte chunks, 1 core"
+    )
+
+    encoded = []
+    speed = measure(total, lambda chunk: encoded.append(codec.encode(chunk)), chunks)
+    click.echo(f"encode              {speed:>10.1f} MB/s")
+
+    for lost in range(parity_shards + 1):
+        # 丢失前 lost 个数据分片，是解码最慢的情况
+        survivors = [
+            {i: shards[i] for i in range(lost, data_shards + lost)}
+            for shards in encoded
+        ]
+        speed = measure(
+            total, lambda shards: codec.decode(shards, chunk_size), survivors
+        )
+        click.echo(f"decode ({lost} lost)     {speed:>10.1f} MB/s")
+
+    overhead = codec.n / codec.k
+    click.echo(
+        f"storage overhead    {overhead:>10.2f}x "
+        f"(vs {replicas}x replication, {1 - overhead / replicas:.0%} less), "
+        f"tolerates {parity_shards} lost shards"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+大文件上传期间小请求的尾延迟：分别以 CPU_THREADS=0（哈希、压缩在事件循环中执行）
+和配置的线程数启动单进程服务，一边流式上传，一边持续请求一个轻量接口。
+
+    python benchmarks/loop_latency.py --size-mb 2048
+    python benchmarks/loop_latency.py --compression zstd --threads 4
+"""
+
+import asyncio
+import http.client
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+PASSWORD = "benchmark"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def setup(workdir: str, compression: str):
+    """初始化数据库并写入部署配置"""
+    import hashlib
+
+    import db
+
+    async def run():
+        await db.init_db()
+        await db.User.update_or_create(
+            username="admin",
+            defaults={"password": hashlib.sha256(PASSWORD.encode()).hexdigest()},
+        )
+        await db.set_cfg("compression", compression)
+        await db.set_cfg("num_storages", 1)
+        await db.set_cfg("write_quorum", 1)
+        await db.Storage.create(
+            name="local",
+            driver="local",
+            priority=5,
+            driver_settings={"path": os.path.join(workdir, "storage")},
+        )
+        await db.Tortoise.close_connections()
+
+    asyncio.run(run())
+
+
+def request(port: int, method: str, path: str, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, data
+
+
+def login(port: int) -> str:
+    import json
+
+    _, data = request(
+        port,
+        "POST",
+        "/api/user/login",
+        json.dumps({"username": "admin", "password": PASSWORD}),
+        {"Content-Type": "application/json"},
+    )
+    return json.loads(data)["data"]
+
+
+def upload(port: int, token: str, size_mb: int, compressible: bool, seed: int):
+    rng = random.Random(seed)
+
+    def blocks():
+        for i in range(size_mb):
+            if compressible:
+                lines = (
+                    f"{i:08d}-{j:05d} INFO request id={rng.getrandbits(32)} ok\n"
+                    for j in range(1024 * 1024 // 48)
+                )
+                yield "".join(lines).encode()[: 1024 * 1024]
+            else:
+                yield rng.randbytes(1024 * 1024)
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=3600)
+    conn.request(
+        "POST",
+        "/api/file/upload/stream",
+        body=blocks(),
+        headers={"X-Authorization": token, "X-Filename": f"bench-{seed}"},
+        encode_chunked=True,
+    )
+    conn.getresponse().read()
+    conn.close()
+
+
+def ping(port: int, stop: threading.Event, latencies: list):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.request("GET", "/api/chunk/cache")
+        conn.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.005)
+    conn.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+def run(threads, size_mb, compression, compressible, pingers, seed):
+    workdir = tempfile.mkdtemp(prefix="kianafs-bench-")
+    env = dict(
+        os.environ,
+        DB_URL=f"sqlite://{os.path.join(workdir, 'KianaFS.db')}",
+        CPU_THREADS=str(threads),
+    )
+    os.environ.update(env)  # setup 子进程导入 db 时读取 DB_URL
+    process = multiprocessing.get_context("spawn").Process(
+        target=setup, args=(workdir, compression)
+    )
+    process.start()
+    process.join()
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port)],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                request(port, "GET", "/api")
+                break
+            except OSError:
+                time.sleep(0.1)
+        token = login(port)
+
+        uploader = multiprocessing.get_context("spawn").Process(
+            target=upload, args=(port, token, size_mb, compressible, seed)
+        )
+        stop = threading.Event()
+        latencies: list = []
+        workers = [
+            threading.Thread(target=ping, args=(port, stop, latencies))
+            for _ in range(pingers)
+        ]
+        start = time.perf_counter()
+        uploader.start()
+        for worker in workers:
+            worker.start()
+        uploader.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for worker in workers:
+            worker.join()
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    label = "inline" if threads == 0 else f"{threads} threads"
+    click.echo(
+        f"{label:<12} upload {size_mb / elapsed:>8.1f} MB/s  "
+        f"p50 {percentile(latencies, 0.5):>7.1f} ms  "
+        f"p99 {percentile(latencies, 0.99):>7.1f} ms  "
+        f"p99.9 {percentile(latencies, 0.999):>7.1f} ms  "
+        f"max {max(latencies) * 1000:>7.1f} ms  ({len(latencies)} requests)"
+    )
+
+
+@click.command()
+@click.option("--size-mb", default=2048, help="上传文件大小 (MiB)")
+@click.option("--threads", default=os.cpu_count() or 4, help="对比的 CPU 线程数")
+@click.option(
+    "--compression", default="none", type=click.Choice(["none", "zstd", "lz4"])
+)
+@click.option("--compressible/--random", default=False, help="上传可压缩的文本数据")
+@click.option("--pingers", default=4, help="并发发起小请求的线程数")
+@click.option("--seed", default=0)
+def main(size_mb, threads, compression, compressible, pingers, seed):
+    for n in (0, threads):
+        run(n, size_mb, compression, compressible, pingers, seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# KianaFS 核心逻辑：分块读写流水线等与 HTTP 层无关的部分
@@ -0,0 +1,106 @@
+import secrets
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import jwt
+from tortoise.signals import post_delete, post_save
+
+import db
+from db import conf
+
+# 用户被修改或删除时更新的配置键
+USERS_VERSION_KEY = "_users_version"
+
+
+class AuthUser:
+    """缓存的已认证用户"""
+
+    __slots__ = ("username", "permission")
+
+    def __init__(self, username: str, permission: str):
+        self.username = username
+        self.permission = permission
+
+    def has_permission(self, permission):
+        return permission in self.permission
+
+
+class AuthCache:
+    """
+    每个 worker 的认证缓存。
+
+    secret_key 只加载一次，set_cfg 修改时失效；
+    已验证的 token 在 ttl 秒内直接映射到用户及权限，任何用户被修改或删除时整体失效。
+    缓存超过 max_size 个 token 时淘汰最久未使用的。
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._secret_key: Optional[str] = None
+        self._tokens: OrderedDict[str, tuple[float, AuthUser]] = OrderedDict()
+
+    async def secret_key(self) -> str:
+        if self._secret_key is None:
+            self._secret_key = await db.get_cfg("secret_key", "114514")  # type: ignore
+        return self._secret_key  # type: ignore
+
+    async def authenticate(self, token: str) -> Optional[AuthUser]:
+        """
+        验证 token 并返回对应用户，用户不存在时返回 None。
+
+        :raises jwt.exceptions.InvalidTokenError: token 无效或已过期
+        """
+        now = time.monotonic()
+        entry = self._tokens.get(token)
+        if entry is not None:
+            if entry[0] > now:
+                self._tokens.move_to_end(token)
+                return entry[1]
+            del self._tokens[token]
+
+        payload = jwt.decode(token, await self.secret_key(), algorithms=["HS256"])
+        if "username" not in payload:
+            raise jwt.exceptions.InvalidTokenError("Invalid token payload")
+
+        user = await db.User.get_or_none(username=payload["username"])
+        if user is None:
+            return None
+
+        expires = now + self.ttl
+        if "exp" in payload:  # 缓存不能超过 token 本身的有效期
+            expires = min(expires, now + payload["exp"] - time.time())
+        auth_user = AuthUser(user.username, user.permission)
+        self._tokens[token] = (expires, auth_user)
+        while len(self._tokens) > self.max_size:
+            self._tokens.popitem(last=False)
+        return auth_user
+
+    def clear(self):
+        self._secret_key = None
+        self._tokens.clear()
+
+
+cache = AuthCache(conf.AUTH_CACHE_TTL)
+
+
+@db.on_cfg_change
+def _cfg_changed(key: str):
+    if key in ("secret_key", USERS_VERSION_KEY):
+        cache.clear()
+
+
+async def _users_changed():
+    # 写入新的用户版本号，配置监听会让所有 worker（包括当前 worker）清空认证缓存
+    await db.set_cfg(USERS_VERSION_KEY, secrets.token_hex(8))
+
+
+@post_save(db.User)
+async def _user_saved(sender, instance, created, using_db, update_fields):
+    await _users_changed()
+
+
+@post_delete(db.User)
+async def _user_deleted(sender, instance, using_db):
+    await _users_changed()
@@ -0,0 +1,129 @@
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from db import conf
+
+
+class LRUCache:
+    """按字节数限制容量的 LRU 缓存"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self.evictions = 0
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.capacity:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._items[key] = value
+        self.size += len(value)
+        while self.size > self.capacity:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+
+def _redis_cache():
+    if not conf.USE_REDIS:
+        return None
+    from aiocache import RedisCache
+    from aiocache.serializers import NullSerializer
+
+    return RedisCache(
+        serializer=NullSerializer(encoding=None),  # 分块以原始字节存储
+        namespace="kianafs:chunk",
+        endpoint=conf.REDIS_HOST,
+        port=conf.REDIS_PORT,
+        db=conf.REDIS_DB,
+        password=conf.REDIS_PASSWORD or None,
+        ttl=conf.EXPIRE_TIME,
+    )
+
+
+class ChunkCache:
+    """
+    分块读缓存：每个进程一个内存 LRU，可选 Redis 作为进程间共享的第二层。
+
+    分块按内容哈希寻址且不可变，因此不需要失效。
+    并发请求同一个未缓存的分块时只会触发一次读取，其余请求等待同一个结果。
+    """
+
+    def __init__(self, capacity: int, redis=None):
+        self.memory = LRUCache(capacity)
+        self.redis = redis
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get(self, key: str, fetch: Callable[[], Awaitable[bytes]]) -> bytes:
+        data = self.memory.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        task = self._inflight.get(key)
+        if task is None:
+            # 读取放在独立任务中，发起请求被取消不影响其他等待者
+            task = asyncio.ensure_future(self._load(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # 所有等待者都已取消时避免未读取异常的警告
+
+    async def _load(self, key: str, fetch: Callable[[], Awaitable[bytes]]) -> bytes:
+        if self.redis is not None:
+            try:
+                data = await self.redis.get(key)
+            except Exception:
+                data = None
+            if data is not None:
+                self.redis_hits += 1
+                self.memory.put(key, data)
+                return data
+
+        self.misses += 1
+        data = await fetch()
+        self.memory.put(key, data)
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, data)
+            except Exception:
+                pass
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "redis_hits": self.redis_hits,
+            "coalesced": self.coalesced,
+            "evictions": self.memory.evictions,
+            "items": len(self.memory),
+            "size": self.memory.size,
+            "capacity": self.memory.capacity,
+        }
+
+
+chunks = ChunkCache(conf.CHUNK_CACHE_SIZE, redis=_redis_cache())
@@ -0,0 +1,128 @@
+from typing import AsyncIterator, List, Tuple, Union
+
+import xxhash
+
+import core.executor
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，仅内容定义分块需要
+    np = None
+
+# Gear 表必须保持不变，否则分块边界改变会使已有分块无法去重
+GEAR = [xxhash.xxh32_intdigest(i.to_bytes(2, "little")) for i in range(256)]
+WINDOW = 32  # 32 位 Gear 哈希只依赖最近 32 个字节
+SEGMENT = 64 * 1024  # 分段计算哈希，使中间数组留在 CPU 缓存中
+
+
+class FastCDC:
+    """
+    基于 Gear 哈希的内容定义分块（FastCDC，归一化级别 2）。
+
+    位置 i 的 32 位哈希为 sum(GEAR[b[i - j]] << j for j in range(32))，只依赖最近 32 个字节，
+    因此可以用 NumPy 按倍增方式整段计算（5 次向量运算），
+    Python 代码只在候选切分点上循环，而不是逐字节循环。
+    """
+
+    def __init__(self, min_size: int, avg_size: int, max_size: int):
+        if np is None:
+            raise RuntimeError(
+                "Content-defined chunking requires numpy (pip install KianaFS[cdc])"
+            )
+        if not 64 <= min_size <= avg_size <= max_size:
+            raise ValueError("CDC sizes must satisfy 64 <= min <= avg <= max")
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        bits = min(max(avg_size.bit_length() - 1, 3), WINDOW - 2)
+        # 使用高位作为掩码：高位依赖的字节窗口最长
+        self.mask_s = np.uint32(((1 << (bits + 2)) - 1) << (WINDOW - bits - 2))
+        self.mask_l = np.uint32(((1 << (bits - 2)) - 1) << (WINDOW - bits + 2))
+        self.gear = np.array(GEAR, dtype=np.uint32)
+
+    def _candidates(self, data) -> Tuple["np.ndarray", "np.ndarray"]:
+        """返回满足严格掩码和宽松掩码的位置"""
+        source = np.frombuffer(data, dtype=np.uint8)
+        overlap = WINDOW - 1
+        buffer = np.empty(SEGMENT + overlap, dtype=np.uint32)
+        shifted = np.empty(SEGMENT + overlap, dtype=np.uint32)
+        strict, loose = [], []
+        for start in range(0, len(source), SEGMENT):
+            lo = max(start - overlap, 0)
+            n = min(start + SEGMENT, len(source)) - lo
+            h = buffer[:n]
+            np.take(self.gear, source[lo : lo + n], out=h)
+            step = 1
+            while step < WINDOW and step < n:
+                np.left_shift(h[:-step], step, out=shifted[: n - step])
+                np.add(h[step:], shifted[: n - step], out=h[step:])
+                step *= 2
+            h = h[start - lo :]
+            # 严格掩码的候选一定也满足宽松掩码
+            hits = np.flatnonzero((h & self.mask_l) == 0)
+            loose.append(hits + start)
+            strict.append(hits[(h[hits] & self.mask_s) == 0] + start)
+        if not loose:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        return np.concatenate(strict), np.concatenate(loose)
+
+    def cut_points(
+        self, data: Union[bytes, bytearray, memoryview], eof: bool
+    ) -> List[int]:
+        """
+        计算 data 中的切分点（分块结束位置）。
+
+        eof 为 False 时，只返回其后仍剩余至少 max_size 字节之前的切分点，
+        剩余数据需要与后续输入拼接后再切分。
+        """
+        size = len(data)
+        if size == 0:
+            return []
+        strict, loose = self._candidates(data)
+
+        cuts = []
+        start = 0
+        while start < size:
+            if not eof and size - start < self.max_size:
+                break
+            if size - start <= self.min_size:
+                cuts.append(size)
+                break
+            end = min(start + self.max_size, size)
+            cut = end
+            # 在 [min, avg) 内使用更严格的掩码，在 [avg, max) 内使用宽松的掩码
+            i = np.searchsorted(strict, start + self.min_size - 1)
+            if i < len(strict) and strict[i] < min(start + self.avg_size, end) - 1:
+                cut = int(strict[i]) + 1
+            else:
+                i = np.searchsorted(loose, start + self.avg_size - 1)
+                if i < len(loose) and loose[i] < end - 1:
+                    cut = int(loose[i]) + 1
+            cuts.append(cut)
+            start = cut
+        return cuts
+
+    async def split(self, blocks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """将任意大小的数据块切分为内容定义的分块"""
+        buffer = bytearray()
+        batch = max(self.max_size * 4, 8 * 1024 * 1024)  # 攒够一批再计算，减少重复哈希
+        async for block in blocks:
+            buffer += block
+            if len(buffer) < batch:
+                continue
+            cuts = await core.executor.cpu.run(
+                self.cut_points, bytes(buffer), False, process=True
+            )
+            start = 0
+            for cut in cuts:
+                yield bytes(buffer[start:cut])
+                start = cut
+            del buffer[:start]
+
+        cuts = await core.executor.cpu.run(
+            self.cut_points, bytes(buffer), True, process=True
+        )
+        start = 0
+        for cut in cuts:
+            yield bytes(buffer[start:cut])
+            start = cut
@@ -0,0 +1,123 @@
+import threading
+from typing import Optional, Tuple
+
+import db
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # 可选依赖
+    lz4 = None
+
+NONE = "none"
+CODECS = (NONE, "zstd", "lz4")
+MIN_SIZE = 512  # 小于此大小的分块不压缩
+SAMPLE_SIZE = 16 * 1024  # 每个采样片段的大小
+SAMPLES = 4  # 采样片段数
+
+_local = threading.local()
+
+
+def _zstd_compressor(level: int):
+    # ZstdCompressor 不是线程安全的，每个线程各用一个
+    compressors = _local.__dict__.setdefault("zstd", {})
+    if level not in compressors:
+        compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressors[level]
+
+
+def _zstd_decompressor():
+    if not hasattr(_local, "zstd_d"):
+        _local.zstd_d = zstandard.ZstdDecompressor()
+    return _local.zstd_d
+
+
+class Compressor:
+    """
+    分块压缩策略。
+
+    较大的分块先压缩几个均匀分布的采样片段，预估压缩率高于 min_ratio 的分块
+    （已压缩的媒体、归档等）直接原样存储；压缩后仍达不到 min_ratio 的分块也原样存储。
+    方法都是同步的 CPU 密集操作，应在线程中调用。
+    """
+
+    def __init__(self, codec: str, level: int, min_ratio: float = 0.9):
+        if codec not in CODECS or codec == NONE:
+            raise ValueError(f"Unknown compression codec {codec}")
+        if codec == "zstd" and zstandard is None:
+            raise RuntimeError(
+                "zstd compression requires zstandard (pip install KianaFS[zstd])"
+            )
+        if codec == "lz4" and lz4 is None:
+            raise RuntimeError(
+                "lz4 compression requires lz4 (pip install KianaFS[lz4])"
+            )
+        self.codec = codec
+        self.level = level
+        self.min_ratio = min_ratio
+
+    def _compress(self, data, level: int) -> bytes:
+        if self.codec == "zstd":
+            return _zstd_compressor(level).compress(data)
+        return lz4.frame.compress(data, compression_level=level)
+
+    def sample_ratio(self, data: bytes) -> float:
+        """用最快的压缩级别压缩采样片段，返回预估的压缩率"""
+        view = memoryview(data)
+        step = (len(data) - SAMPLE_SIZE) // (SAMPLES - 1)
+        raw = compressed = 0
+        for i in range(SAMPLES):
+            sample = view[i * step : i * step + SAMPLE_SIZE]
+            raw += len(sample)
+            compressed += len(self._compress(sample, 1 if self.codec == "zstd" else 0))
+        return compressed / raw
+
+    def compress(self, data: bytes) -> Tuple[str, bytes]:
+        """
+        :return: (实际使用的编码, 存储的数据)，不压缩时编码为 "none"
+        """
+        if len(data) < MIN_SIZE:
+            return NONE, data
+        if (
+            len(data) >= SAMPLE_SIZE * SAMPLES * 4
+            and self.sample_ratio(data) > self.min_ratio
+        ):
+            return NONE, data
+        payload = self._compress(data, self.level)
+        if len(payload) > len(data) * self.min_ratio:
+            return NONE, data
+        return self.codec, payload
+
+
+def decompress(codec: str, payload: bytes) -> bytes:
+    if codec == NONE or not codec:
+        return payload
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError(
+                "zstd compression requires zstandard (pip install KianaFS[zstd])"
+            )
+        return _zstd_decompressor().decompress(payload)
+    if codec == "lz4":
+        if lz4 is None:
+            raise RuntimeError(
+                "lz4 compression requires lz4 (pip install KianaFS[lz4])"
+            )
+        return lz4.frame.decompress(payload)
+    raise ValueError(f"Unknown compression codec {codec}")
+
+
+async def get_compressor() -> Optional[Compressor]:
+    """按部署配置返回压缩策略，compression 为 "none" 时返回 None"""
+    codec = await db.get_cfg("compression", NONE)
+    if codec == NONE:
+        return None
+    return Compressor(
+        codec,
+        await db.get_cfg("compression_level", 3 if codec == "zstd" else 0),
+        await db.get_cfg("compression_min_ratio", 0.9),
+    )
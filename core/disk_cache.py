@@ -0,0 +1,172 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import anyio.to_thread
+
+from db import conf
+
+
+class DiskCache:
+    """
+    本地磁盘分块缓存，位于远程存储驱动之前。
+
+    分块文件保存在 {path}/{hash[:2]}/{hash}，索引和统计保存在 {path}/index.db (SQLite, WAL)，
+    重启后仍然有效，并由同一台机器上的所有 uvicorn worker 共享。
+    分块按内容哈希寻址且不可变，因此只需要按最近访问时间 (LRU) 淘汰，不需要失效。
+    所有磁盘和索引操作都在线程中执行。
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self._local = threading.local()
+        self._writes: set[asyncio.Task] = set()
+        os.makedirs(path, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "hash TEXT PRIMARY KEY, size INTEGER NOT NULL, atime REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_atime ON entries (atime)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, "index.db"), timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _file(self, hash: str) -> str:
+        return os.path.join(self.path, hash[:2], hash)
+
+    @staticmethod
+    def _incr(conn: sqlite3.Connection, key: str, value: int):
+        conn.execute(
+            "INSERT INTO stats (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            (key, value),
+        )
+
+    def _get(self, hash: str) -> Optional[bytes]:
+        conn = self._connect()
+        try:
+            with open(self._file(hash), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            # 文件已丢失：删除索引记录，并从缓存大小中扣除
+            with conn:
+                row = conn.execute(
+                    "SELECT size FROM entries WHERE hash = ?", (hash,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM entries WHERE hash = ?", (hash,))
+                    self._incr(conn, "size", -row[0])
+                self._incr(conn, "misses", 1)
+            return None
+        with conn:
+            conn.execute(
+                "UPDATE entries SET atime = ? WHERE hash = ?", (time.time(), hash)
+            )
+            self._incr(conn, "hits", 1)
+            self._incr(conn, "bytes_served", len(data))
+        return data
+
+    def _put(self, hash: str, data: bytes):
+        if len(data) > self.capacity:
+            return
+        file = self._file(hash)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        # 先写临时文件再原子替换，其他 worker 不会读到写了一半的分块
+        temp = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, file)
+
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO entries (hash, size, atime) VALUES (?, ?, ?)",
+                (hash, len(data), time.time()),
+            )
+            if cursor.rowcount:
+                self._incr(conn, "size", len(data))
+        self._evict()
+
+    def _evict(self):
+        conn = self._connect()
+        while True:
+            with conn:
+                row = conn.execute(
+                    "SELECT value FROM stats WHERE key = 'size'"
+                ).fetchone()
+                if row is None or row[0] <= self.capacity:
+                    return
+                # 淘汰到容量的 90%，避免每次写入都触发淘汰
+                excess = row[0] - self.capacity * 9 // 10
+                victims = conn.execute(
+                    "SELECT hash, size FROM entries ORDER BY atime LIMIT 256"
+                ).fetchall()
+                if not victims:
+                    return
+                removed = []
+                for hash, size in victims:
+                    removed.append((hash, size))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                conn.executemany(
+                    "DELETE FROM entries WHERE hash = ?", [(h,) for h, _ in removed]
+                )
+                self._incr(conn, "size", -sum(size for _, size in removed))
+                self._incr(conn, "evictions", len(removed))
+            for hash, _ in removed:
+                try:
+                    os.remove(self._file(hash))
+                except FileNotFoundError:
+                    pass
+
+    def _stats(self) -> dict:
+        with self._connect() as conn:
+            stats = dict(conn.execute("SELECT key, value FROM stats").fetchall())
+            items = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "bytes_served": stats.get("bytes_served", 0),
+            "evictions": stats.get("evictions", 0),
+            "items": items,
+            "size": stats.get("size", 0),
+            "capacity": self.capacity,
+        }
+
+    async def get(self, hash: str) -> Optional[bytes]:
+        return await anyio.to_thread.run_sync(self._get, hash)
+
+    def put(self, hash: str, data: bytes):
+        """在后台写入缓存，不阻塞读取路径"""
+        task = asyncio.ensure_future(anyio.to_thread.run_sync(self._put, hash, data))
+        self._writes.add(task)
+        task.add_done_callback(self._written)
+
+    def _written(self, task: asyncio.Task):
+        self._writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Failed to write disk cache: {task.exception()}")
+
+    async def stats(self) -> dict:
+        return await anyio.to_thread.run_sync(self._stats)
+
+
+chunks: Optional[DiskCache] = None
+if conf.DISK_CACHE_DIR:
+    chunks = DiskCache(conf.DISK_CACHE_DIR, conf.DISK_CACHE_SIZE)
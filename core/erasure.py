@@ -0,0 +1,439 @@
+import asyncio
+import random
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import xxhash
+from tortoise.expressions import F, Q
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+import core.compression
+import core.executor
+import core.replication
+import core.scheduler
+import db
+import drivers
+from core.replication import ReplicationError, upload, write_order
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，仅纠删码需要
+    np = None
+
+POLY = 0x11D  # GF(2^8) 本原多项式 x^8 + x^4 + x^3 + x^2 + 1
+
+EXP = [0] * 512
+LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    EXP[_i] = _x
+    LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= POLY
+for _i in range(255, 512):
+    EXP[_i] = EXP[_i - 255]
+
+if np is not None:
+    # MUL[a] 是乘以 a 的查找表，按字节查表即可完成整个分片的乘法
+    _log = np.array(LOG, dtype=np.int32)
+    MUL = np.array(EXP, dtype=np.uint8)[_log[:, None] + _log[None, :]]
+    MUL[0, :] = 0
+    MUL[:, 0] = 0
+
+
+class ErasureError(RuntimeError):
+    pass
+
+
+def gf_mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return EXP[LOG[a] + LOG[b]]
+
+
+def gf_inv(a: int) -> int:
+    return EXP[255 - LOG[a]]
+
+
+def _invert(matrix: List[List[int]]) -> List[List[int]]:
+    """GF(256) 上的 Gauss-Jordan 消元求逆"""
+    n = len(matrix)
+    rows = [row[:] + [int(i == j) for j in range(n)] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = next(r for r in range(col, n) if rows[r][col])
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        inv = gf_inv(rows[col][col])
+        rows[col] = [gf_mul(v, inv) for v in rows[col]]
+        for r in range(n):
+            factor = rows[r][col]
+            if r != col and factor:
+                rows[r] = [v ^ gf_mul(factor, p) for v, p in zip(rows[r], rows[col])]
+    return [row[n:] for row in rows]
+
+
+class ReedSolomon:
+    """
+    系统化 Reed–Solomon 编码，k 个数据分片 + m 个校验分片，任意 k 个分片即可恢复原数据。
+
+    编码矩阵为单位矩阵拼接 Cauchy 矩阵，其任意 k 行构成的方阵都可逆。
+    分片间的 GF(256) 乘法通过 NumPy 按字节查 MUL 表完成，加法为异或。
+    """
+
+    def __init__(self, data_shards: int, parity_shards: int):
+        if np is None:
+            raise RuntimeError(
+                "Erasure coding requires numpy (pip install KianaFS[ec])"
+            )
+        if data_shards < 1 or parity_shards < 0 or data_shards + parity_shards > 256:
+            raise ValueError("Erasure coding requires k >= 1, m >= 0 and k + m <= 256")
+        self.k = data_shards
+        self.m = parity_shards
+        self.matrix = [[int(i == j) for j in range(self.k)] for i in range(self.k)]
+        self.matrix += [
+            [gf_inv((self.k + i) ^ j) for j in range(self.k)] for i in range(self.m)
+        ]
+
+    @property
+    def n(self) -> int:
+        return self.k + self.m
+
+    def shard_size(self, size: int) -> int:
+        return max(1, -(-size // self.k))
+
+    @staticmethod
+    def _combine(coefficients: List[int], rows) -> "np.ndarray":
+        out = np.zeros(rows[0].shape, dtype=np.uint8)
+        for c, row in zip(coefficients, rows):
+            if c == 1:
+                np.bitwise_xor(out, row, out=out)
+            elif c:
+                np.bitwise_xor(out, MUL[c].take(row), out=out)
+        return out
+
+    def encode(self, data: bytes) -> List[bytes]:
+        """将 data 补零后切分为 k 个数据分片，并计算 m 个校验分片"""
+        size = self.shard_size(len(data))
+        buffer = np.zeros(self.k * size, dtype=np.uint8)
+        buffer[: len(data)] = np.frombuffer(data, dtype=np.uint8)
+        rows = buffer.reshape(self.k, size)
+        shards = [row.tobytes() for row in rows]
+        for coefficients in self.matrix[self.k :]:
+            shards.append(self._combine(coefficients, rows).tobytes())
+        return shards
+
+    def decode(self, shards: Dict[int, bytes], size: int) -> bytes:
+        """
+        从任意 k 个分片恢复原数据。
+
+        :param shards: 分片序号到分片数据的映射
+        :param size: 原数据长度
+        """
+        if len(shards) < self.k:
+            raise ErasureError(f"Need {self.k} shards, got {len(shards)}")
+        indices = sorted(shards)[: self.k]
+        if indices == list(range(self.k)):  # 数据分片齐全，无需解码
+            return b"".join(shards[i] for i in indices)[:size]
+
+        rows = [np.frombuffer(shards[i], dtype=np.uint8) for i in indices]
+        inverse = _invert([self.matrix[i] for i in indices])
+        data = []
+        for j in range(self.k):
+            if j in shards:
+                data.append(shards[j])
+            else:
+                data.append(self._combine(inverse[j], rows).tobytes())
+        return b"".join(data)[:size]
+
+
+async def get_codec() -> Optional[ReedSolomon]:
+    """按部署配置返回纠删码编码器，redundancy 不为 "erasure" 时返回 None"""
+    if await db.get_cfg("redundancy", "replication") != "erasure":
+        return None
+    return ReedSolomon(
+        await db.get_cfg("ec_data_shards", 4), await db.get_cfg("ec_parity_shards", 2)
+    )
+
+
+def shard_key(hash: str, index: int) -> str:
+    return f"{hash}.{index}"
+
+
+def _restore(
+    chunk: db.Chunk, codec: ReedSolomon, shards: Dict[int, bytes]
+) -> Tuple[bytes, bytes]:
+    """
+    解码分片并校验分块哈希。
+
+    :return: (存储的数据, 解压后的分块数据)
+    """
+    size = (
+        chunk.stored_size if chunk.stored_size is not None else round(chunk.size * 1024)
+    )
+    payload = codec.decode(shards, size)
+    data = core.compression.decompress(chunk.codec, payload)
+    if xxhash.xxh3_128_hexdigest(data) != chunk.hash:
+        raise ErasureError(f"Reconstructed chunk {chunk.hash} is corrupted")
+    return payload, data
+
+
+def _shard_size(chunk: db.Chunk, codec: ReedSolomon) -> int:
+    size = (
+        chunk.stored_size if chunk.stored_size is not None else round(chunk.size * 1024)
+    )
+    return codec.shard_size(size)
+
+
+class ErasureWrite:
+    """
+    将一个分块编码为 k + m 个分片，分别写入不同的存储节点。
+
+    接口与 Replication 相同。分片写入失败时换用下一个候选节点重试，
+    wait() 在所有分片写入结束后返回，至少写入 k + ceil(m / 2) 个分片才算成功，
+    缺失的分片之后由 repair() 补齐。
+    """
+
+    def __init__(
+        self, data: bytes, hash: str, storage_list: List[db.Storage], codec: ReedSolomon
+    ):
+        self.data = data
+        self.hash = hash
+        self.codec = codec
+        self.candidates = deque(write_order(storage_list))
+        self.quorum = codec.k + (codec.m + 1) // 2
+        self.stored: List[Tuple[int, db.Storage]] = []  # (分片序号, 存储节点)
+        self.acked: List[Tuple[int, db.Storage]] = []
+        self.errors: List[BaseException] = []
+
+    async def _put(self, index: int, shard: bytes):
+        while self.candidates:
+            storage = self.candidates.popleft()
+            try:
+                await upload(storage, shard, shard_key(self.hash, index))
+            except Exception as e:
+                self.errors.append(e)
+                continue
+            self.stored.append((index, storage))
+            return
+
+    async def wait(self) -> List[Tuple[int, db.Storage]]:
+        if len(self.candidates) < self.codec.n:
+            raise ReplicationError(
+                f"Erasure coding needs {self.codec.n} storages, only {len(self.candidates)} available"
+            )
+        shards = await core.executor.cpu.run(self.codec.encode, self.data)
+        self.data = b""
+        tasks = [
+            asyncio.create_task(self._put(index, shard))
+            for index, shard in enumerate(shards)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        if len(self.stored) < self.quorum:
+            raise ReplicationError(
+                f"Failed to upload {self.quorum} shards. Succeeded: {len(self.stored)}"
+            )
+        self.acked = list(self.stored)
+        return self.acked
+
+    @property
+    def done(self) -> bool:
+        return True
+
+    async def finish(self) -> List[Tuple[int, db.Storage]]:
+        return self.stored
+
+    def add_done_callback(self, callback):
+        callback()
+
+    def cancel(self):
+        pass
+
+    def link_stragglers(self):
+        pass
+
+
+async def _get_shard(shard: db.Shard, chunk_hash: str, size: int) -> Tuple[int, bytes]:
+    async with core.scheduler.reads.track(shard.storage):
+        async with drivers.registry.use(shard.storage) as driver:
+            data = await driver.get_chunk(shard_key(chunk_hash, shard.index))
+    if len(data) != size:
+        raise ErasureError(f"Shard {shard.index} has wrong size {len(data)}")
+    return shard.index, data
+
+
+async def read(chunk: db.Chunk, shards: List[db.Shard]) -> bytes:
+    """
+    并发读取任意 k 个分片，恢复并解压分块。
+
+    优先读取数据分片（全部成功时无需解码），同类分片中优先读取延迟低且未熔断的节点，
+    某个分片读取失败时再补读一个校验分片。读取中发现分片缺失或损坏时在后台修复。
+    """
+    codec = ReedSolomon(chunk.ec_data, chunk.ec_parity)
+    shard_size = _shard_size(chunk, codec)
+    reads = core.scheduler.reads
+    pending = deque(
+        sorted(
+            shards,
+            key=lambda s: (
+                s.index >= codec.k,
+                reads.is_open(s.storage),
+                reads.score(s.storage) * (1 + 0.1 * random.random()),
+            ),
+        )
+    )
+    running: set[asyncio.Task] = set()
+    got: Dict[int, bytes] = {}
+    degraded = len(shards) < codec.n
+
+    def spawn():
+        shard = pending.popleft()
+        reads.available(shard.storage)  # 发往熔断到期节点的请求即为试探，重新计时
+        running.add(asyncio.create_task(_get_shard(shard, chunk.hash, shard_size)))
+
+    for _ in range(min(codec.k, len(pending))):
+        spawn()
+    try:
+        while running and len(got) < codec.k:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                running.discard(task)
+                try:
+                    index, data = task.result()
+                    got[index] = data
+                except Exception:
+                    degraded = True
+                    if pending:
+                        spawn()
+    finally:
+        for task in running:
+            task.cancel()
+
+    if degraded:
+        schedule_repair(chunk.hash)
+    if len(got) < codec.k:
+        raise ErasureError(
+            f"Only {len(got)} of {codec.k} shards are readable for chunk {chunk.hash}"
+        )
+    _, data = await core.executor.cpu.run(_restore, chunk, codec, got)
+    return data
+
+
+async def repair(chunk_hash: str) -> int:
+    """
+    检查分块的全部分片，重新生成缺失、损坏或位于停用节点上的分片。
+
+    新分片优先写入尚未保存该分块任何分片的存储节点。
+
+    :return: 重新写入的分片数
+    """
+    chunk = await db.Chunk.get_or_none(hash=chunk_hash)
+    if chunk is None or not chunk.ec_data:
+        return 0
+    codec = ReedSolomon(chunk.ec_data, chunk.ec_parity)
+    shards = await db.Shard.filter(chunk=chunk).select_related("storage")
+    live = [s for s in shards if s.storage.enabled]
+
+    results = await asyncio.gather(
+        *(_get_shard(s, chunk_hash, _shard_size(chunk, codec)) for s in live),
+        return_exceptions=True,
+    )
+    got = dict(r for r in results if not isinstance(r, BaseException))
+    missing = [i for i in range(codec.n) if i not in got]
+    if not missing:
+        return 0
+    if len(got) < codec.k:
+        raise ErasureError(
+            f"Only {len(got)} of {codec.k} shards are readable for chunk {chunk_hash}"
+        )
+
+    payload, _ = await core.executor.cpu.run(_restore, chunk, codec, got)
+    encoded = await core.executor.cpu.run(codec.encode, payload)
+
+    used = {s.storage.id for s in live if s.index in got}
+    storage_list = await db.Storage.filter(enabled=True).all()
+    candidates = deque(
+        write_order([s for s in storage_list if s.id not in used])
+        + write_order([s for s in storage_list if s.id in used])
+    )
+    written: List[Tuple[int, db.Storage]] = []
+    for index in missing:
+        while candidates:
+            storage = candidates.popleft()
+            try:
+                await upload(storage, encoded[index], shard_key(chunk_hash, index))
+            except Exception:
+                continue
+            written.append((index, storage))
+            break
+
+    async with in_transaction() as conn:
+        await db.Shard.filter(
+            chunk=chunk, index__in=[index for index, _ in written]
+        ).using_db(conn).delete()
+        await db.Shard.bulk_create(
+            [
+                db.Shard(chunk=chunk, index=index, storage=storage)
+                for index, storage in written
+            ],
+            using_db=conn,
+        )
+
+    # 尽量删除被替换的旧分片，失败时忽略（例如节点已停用或不可达）
+    moved = {index: storage.id for index, storage in written}
+    for shard in shards:
+        if shard.index in moved and moved[shard.index] != shard.storage.id:
+            try:
+                async with drivers.registry.use(shard.storage) as driver:
+                    await driver.delete_chunk(shard_key(chunk_hash, shard.index))
+            except Exception:
+                pass
+    return len(written)
+
+
+_repairing: set[str] = set()
+
+
+def schedule_repair(chunk_hash: str):
+    """在后台修复分块，同一分块同时只修复一次"""
+    if chunk_hash in _repairing:
+        return
+
+    async def run():
+        try:
+            await repair(chunk_hash)
+        except Exception as e:
+            print(f"Failed to repair chunk {chunk_hash}: {e}")
+        finally:
+            _repairing.discard(chunk_hash)
+
+    _repairing.add(chunk_hash)
+    core.replication.spawn(run())
+
+
+async def repair_degraded(limit: int = 1000) -> Tuple[int, int]:
+    """
+    修复可用分片数不足 k + m 的分块。
+
+    :return: (检查的分块数, 重新写入的分片数)
+    """
+    enabled = await db.Storage.filter(enabled=True).values_list("id", flat=True)
+    degraded = (
+        await db.Chunk.filter(ec_data__gt=0)
+        .annotate(live=Count("shards", _filter=Q(shards__storage_id__in=enabled)))
+        .filter(live__lt=F("ec_data") + F("ec_parity"))
+        .limit(limit)
+        .values_list("hash", flat=True)
+    )
+    written = 0
+    for chunk_hash in degraded:
+        try:
+            written += await repair(chunk_hash)
+        except Exception as e:
+            print(f"Failed to repair chunk {chunk_hash}: {e}")
+    return len(degraded), written
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from db import conf
+
+T = TypeVar("T")
+
+
+class CPUExecutor:
+    """
+    分块流水线中 CPU 密集操作（哈希、压缩、纠删码、内容定义分块）的专用执行器。
+
+    与 anyio 默认线程池（同步接口和驱动的阻塞 I/O 使用）分开，两类任务不会互相占满线程。
+    线程池适合会释放 GIL 的 C 扩展（xxhash、zstandard、lz4、NumPy），
+    process=True 的任务在配置了进程池时交给进程池执行，用于以 Python 代码为主的计算。
+    threads 为 0 时直接在事件循环中执行，便于对比。
+    """
+
+    def __init__(self, threads: int, processes: int = 0):
+        self.threads = threads
+        self.processes = processes
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0  # 排队及执行中的任务数
+        self.max_pending = 0
+        self.completed = 0
+        self.wait_time = 0.0  # 线程池任务累计排队时间
+        self.busy_time = 0.0  # 线程池任务累计执行时间
+
+    def _pool(self, process: bool) -> Optional[Executor]:
+        if process and self.processes > 0:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(self.processes)
+            return self._processes
+        if self.threads > 0:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(
+                    self.threads, thread_name_prefix="kianafs-cpu"
+                )
+            return self._threads
+        return None
+
+    def _timed(self, submitted: float, func: Callable[..., T], *args) -> T:
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.wait_time += start - submitted
+                self.busy_time += end - start
+
+    async def run(self, func: Callable[..., T], *args, process: bool = False) -> T:
+        """
+        在执行器中调用 func(*args)。
+
+        :param process: 是否优先使用进程池，此时 func 和参数必须可以被 pickle
+        """
+        pool = self._pool(process)
+        if pool is None:
+            return func(*args)
+
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        loop = asyncio.get_running_loop()
+        try:
+            if isinstance(pool, ProcessPoolExecutor):
+                return await loop.run_in_executor(pool, func, *args)
+            return await loop.run_in_executor(
+                pool, self._timed, time.perf_counter(), func, *args
+            )
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            wait_time, busy_time = self.wait_time, self.busy_time
+        return {
+            "threads": self.threads,
+            "processes": self.processes,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "avg_wait_ms": wait_time / max(self.completed, 1) * 1000,
+            "busy_seconds": busy_time,
+        }
+
+    def shutdown(self):
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
+
+
+cpu = CPUExecutor(conf.CPU_THREADS, conf.CPU_PROCESSES)
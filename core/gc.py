@@ -0,0 +1,255 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+import core.lease
+import core.pack
+import db
+import drivers
+from core.erasure import shard_key
+
+RELEASE_BATCH = 500  # 每条 UPDATE 语句更新的分块数
+
+
+async def release(hashes: Iterable[str], using_db=None):
+    """
+    减少分块的引用计数，应在删除文件元数据的事务中调用。
+
+    引用计数归零的分块不会立即删除，而是在宽限期过后由 GarbageCollector 回收。
+
+    :param hashes: 文件引用的分块哈希，不应包含重复项
+    """
+    hashes = list(hashes)
+    now = datetime.now(timezone.utc)
+    for i in range(0, len(hashes), RELEASE_BATCH):
+        await (
+            db.Chunk.filter(hash__in=hashes[i : i + RELEASE_BATCH], refcount__gt=0)
+            .using_db(using_db)
+            .update(refcount=F("refcount") - 1, update_time=core.lease.touch(now))
+        )
+
+
+class RateLimiter:
+    """每秒最多放行 rate 次操作，rate 不大于 0 时不限速"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class GarbageCollector:
+    """
+    后台回收引用计数为 0 的分块。
+
+    每批取出最多 gc_batch 个超过宽限期的孤立分块，在一个事务中逐个带条件删除其元数据
+    （引用计数仍为 0 且仍超过宽限期），只有元数据确实被删除的分块才会从存储节点删除。
+    因此多个进程同时回收、或上传在回收期间重新引用了分块都不会误删数据。
+    打包的分块只扣减所在打包对象的存活字节数，不再包含存活分块的打包对象过了宽限期后整体删除。
+    上传期间持有租约（core.lease）的分块和打包对象 update_time 在未来，租约到期并再经过宽限期后才会被回收。
+    存储节点上的删除最多 gc_concurrency 个并发，并限制为每秒 gc_rate 次。
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.collected = 0  # 已删除元数据的分块数
+        self.packs = 0  # 已删除的打包对象数
+        self.deleted = 0  # 已从存储节点删除的副本数
+        self.failed = 0  # 删除失败的副本数
+
+    async def _collect(
+        self, cutoff: datetime, batch: int
+    ) -> List[Tuple[str, List[Tuple[str, db.Storage]]]]:
+        """:return: (分块哈希, [(对象名, 存储节点)]) 列表"""
+        candidates = (
+            await db.Chunk.filter(refcount=0, update_time__lt=cutoff)
+            .limit(batch)
+            .prefetch_related("storages", "shards__storage")
+        )
+        collected = []
+        now = datetime.now(timezone.utc)
+        async with in_transaction() as conn:
+            for chunk in candidates:
+                deleted = (
+                    await db.Chunk.filter(
+                        hash=chunk.hash,
+                        refcount=0,
+                        update_time__lt=cutoff,
+                        pack_id=chunk.pack_id,  # type: ignore
+                    )
+                    .using_db(conn)
+                    .delete()
+                )
+                if deleted and chunk.pack_id is not None:  # type: ignore
+                    # 打包的分块只减少所在对象的存活字节数，对象整体由 _collect_packs 回收
+                    await db.Pack.filter(id=chunk.pack_id).using_db(conn).update(  # type: ignore
+                        live=F("live") - chunk.stored_size,
+                        update_time=core.lease.touch(now),
+                    )
+                    collected.append((chunk.hash, []))
+                elif deleted:
+                    await chunk.storages.clear(using_db=conn)
+                    objects = [(chunk.hash, storage) for storage in chunk.storages]
+                    objects += [
+                        (shard_key(chunk.hash, shard.index), shard.storage)
+                        for shard in chunk.shards
+                    ]
+                    collected.append((chunk.hash, objects))
+        return collected
+
+    async def _collect_packs(
+        self, cutoff: datetime, batch: int
+    ) -> List[Tuple[str, List[Tuple[str, db.Storage]]]]:
+        """回收不再包含存活分块、且超过宽限期的打包对象"""
+        candidates = (
+            await db.Pack.filter(live__lte=0, update_time__lt=cutoff)
+            .limit(batch)
+            .prefetch_related("storages")
+        )
+        collected = []
+        async with in_transaction() as conn:
+            for pack in candidates:
+                if await db.Chunk.exists(pack_id=pack.id, using_db=conn):
+                    continue  # 存活字节数有偏差时以分块记录为准
+                await pack.storages.clear(using_db=conn)
+                deleted = (
+                    await db.Pack.filter(
+                        id=pack.id, live__lte=0, update_time__lt=cutoff
+                    )
+                    .using_db(conn)
+                    .delete()
+                )
+                if deleted:
+                    collected.append(
+                        (pack.id, [(pack.id, storage) for storage in pack.storages])
+                    )
+        return collected
+
+    async def _delete(
+        self,
+        key: str,
+        storage: db.Storage,
+        slots: asyncio.Semaphore,
+        limiter: RateLimiter,
+    ):
+        async with slots:
+            await limiter.wait()
+            try:
+                async with drivers.registry.use(storage) as driver:
+                    await driver.delete_chunk(key)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to delete chunk {key} from {storage.name}: {e}")
+                return
+            self.deleted += 1
+
+    async def run_once(self) -> int:
+        """
+        回收当前所有可回收的分块。
+
+        :return: 本次回收的分块数
+        """
+        async with self._lock:
+            grace = await db.get_cfg("gc_grace_period", 3600)
+            batch = max(1, await db.get_cfg("gc_batch", 256))
+            slots = asyncio.Semaphore(max(1, await db.get_cfg("gc_concurrency", 8)))
+            limiter = RateLimiter(await db.get_cfg("gc_rate", 100))
+
+            total = 0
+            while True:
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace)
+                collected = await self._collect(cutoff, batch)
+                await self._delete_all(collected, slots, limiter)
+                total += len(collected)
+                self.collected += len(collected)
+                if len(collected) < batch:
+                    break
+            while True:
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace)
+                collected = await self._collect_packs(cutoff, batch)
+                await self._delete_all(collected, slots, limiter)
+                self.packs += len(collected)
+                if len(collected) < batch:
+                    return total
+
+    async def delete_objects(self, objects: List[Tuple[str, db.Storage]]):
+        """
+        删除没有任何记录引用的存储对象（如未达到写入法定数的副本、并发上传同一分块时落选的分片），
+        并发数和速率限制与后台回收相同，结果计入回收统计。
+
+        :param objects: (对象名, 存储节点) 列表
+        """
+        if not objects:
+            return
+        slots = asyncio.Semaphore(max(1, await db.get_cfg("gc_concurrency", 8)))
+        limiter = RateLimiter(await db.get_cfg("gc_rate", 100))
+        await self._delete_all([("", objects)], slots, limiter)
+
+    async def _delete_all(
+        self,
+        collected: List[Tuple[str, List[Tuple[str, db.Storage]]]],
+        slots: asyncio.Semaphore,
+        limiter: RateLimiter,
+    ):
+        await asyncio.gather(
+            *(
+                self._delete(key, storage, slots, limiter)
+                for _, objects in collected
+                for key, storage in objects
+            )
+        )
+
+    async def _loop(self):
+        while True:
+            interval = await db.get_cfg("gc_interval", 60)
+            if interval > 0:
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    print(f"Garbage collection failed: {e}")
+                try:
+                    await core.pack.compact()
+                except Exception as e:
+                    print(f"Pack compaction failed: {e}")
+            await asyncio.sleep(interval if interval > 0 else 60)
+
+    def start(self):
+        """启动后台回收任务，gc_interval 不大于 0 时暂停回收"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "collected": self.collected,
+            "packs": self.packs,
+            "deleted": self.deleted,
+            "failed": self.failed,
+        }
+
+
+collector = GarbageCollector()
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import core.scheduler
+import db
+import drivers
+
+
+class ProbeResult:
+    """单个存储节点最近一次健康探测的结果"""
+
+    def __init__(self):
+        self.ok: Optional[bool] = None  # 尚未探测时为 None
+        self.latency: Optional[float] = None  # 探测耗时（秒）
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None  # time.time()
+        self.probes = 0
+        self.probe_failures = 0
+
+
+class HealthMonitor:
+    """
+    后台定期探测所有启用的存储节点。
+
+    每隔 health_interval 秒并发调用各节点驱动的 ping()，超过 health_timeout 秒视为失败。
+    探测结果计入 core.scheduler.reads 的熔断统计：连续失败的节点被移出读写选择，
+    熔断中的节点探测成功后立即恢复，不必等待真实请求来试探。
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.results: Dict[int, ProbeResult] = {}
+
+    async def probe(self, storage: db.Storage, timeout: float) -> bool:
+        result = self.results.setdefault(storage.id, ProbeResult())
+        start = time.monotonic()
+        try:
+            async with asyncio.timeout(timeout):
+                async with drivers.registry.use(storage) as driver:
+                    await driver.ping()
+        except Exception as e:
+            result.ok = False
+            result.error = f"{type(e).__name__}: {e}"
+            result.probe_failures += 1
+        else:
+            result.ok = True
+            result.error = None
+        result.latency = time.monotonic() - start
+        result.checked_at = time.time()
+        result.probes += 1
+        core.scheduler.reads.record(storage, None, result.ok)
+        return result.ok
+
+    async def run_once(self) -> int:
+        """
+        探测所有启用的存储节点。
+
+        :return: 探测失败的节点数
+        """
+        timeout = await db.get_cfg("health_timeout", 5)
+        storage_list: List[db.Storage] = await db.Storage.filter(enabled=True).all()
+        for storage_id in set(self.results) - {s.id for s in storage_list}:
+            del self.results[storage_id]
+        results = await asyncio.gather(
+            *(self.probe(storage, timeout) for storage in storage_list)
+        )
+        return results.count(False)
+
+    async def _loop(self):
+        while True:
+            interval = await db.get_cfg("health_interval", 30)
+            if interval > 0:
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    print(f"Storage health check failed: {e}")
+            await asyncio.sleep(interval if interval > 0 else 30)
+
+    def start(self):
+        """启动后台探测任务，health_interval 不大于 0 时暂停探测"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def state(self, storage: db.Storage) -> str:
+        """
+        :return: "open"（熔断中，不参与读写选择）、"down"（最近一次探测失败）、
+            "up" 或 "unknown"（尚未探测）
+        """
+        if core.scheduler.reads.is_open(storage):
+            return "open"
+        result = self.results.get(storage.id)
+        if result is None or result.ok is None:
+            return "unknown"
+        return "up" if result.ok else "down"
+
+    def snapshot(self, storage_list: List[db.Storage]) -> List[dict]:
+        traffic = core.scheduler.reads.snapshot()["storages"]
+        report = []
+        for storage in storage_list:
+            result = self.results.get(storage.id) or ProbeResult()
+            report.append(
+                {
+                    "id": storage.id,
+                    "name": storage.name,
+                    "driver": storage.driver,
+                    "enabled": storage.enabled,
+                    "state": self.state(storage) if storage.enabled else "disabled",
+                    "probe": {
+                        "ok": result.ok,
+                        "latency_ms": (
+                            result.latency * 1000
+                            if result.latency is not None
+                            else None
+                        ),
+                        "error": result.error,
+                        "checked_at": result.checked_at,
+                        "probes": result.probes,
+                        "failures": result.probe_failures,
+                    },
+                    "traffic": traffic.get(storage.id),
+                }
+            )
+        return report
+
+
+monitor = HealthMonitor()
@@ -0,0 +1,450 @@
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import xxhash
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+import core.chunker
+import core.compression
+import core.erasure
+import core.executor
+import core.gc
+import core.lease
+import core.pack
+import db
+from core.replication import Replication, add_chunk, spawn
+
+BATCH_BYTES = 16 * 1024 * 1024  # 待去重窗口的最大字节数
+REFCOUNT_BATCH = 500  # 每条 UPDATE 语句更新的分块数
+INLINE_HASH_SIZE = 64 * 1024  # 小于此大小的分块直接在事件循环中计算哈希
+
+
+async def hash_chunk(chunk: bytes) -> str:
+    if len(chunk) < INLINE_HASH_SIZE:
+        return xxhash.xxh3_128_hexdigest(chunk)
+    return await core.executor.cpu.run(xxhash.xxh3_128_hexdigest, chunk)
+
+
+class ChunkCollectedError(RuntimeError):
+    """去重命中的分块在提交前被垃圾回收"""
+
+
+async def read_blocks(file, block_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """按 block_size 从类文件对象中读取数据块"""
+    while block := await file.read(block_size):
+        yield block
+
+
+async def reframe(
+    blocks: AsyncIterator[bytes], chunk_size: int
+) -> AsyncIterator[bytes]:
+    """
+    将任意大小的数据块重新切分为 chunk_size 大小的分块。
+
+    最多缓冲一个不完整的分块；缓冲区是复用的 bytearray，输入通过 memoryview 切片写入，
+    恰好对齐的整块直接透传，不产生额外拷贝。
+    """
+    buffer = bytearray(chunk_size)
+    filled = 0
+    async for block in blocks:
+        if filled == 0 and len(block) == chunk_size:
+            yield bytes(block)  # block 已是 bytes 时不拷贝
+            continue
+
+        view = memoryview(block)
+        while len(view):
+            if filled == 0 and len(view) >= chunk_size:
+                yield bytes(view[:chunk_size])
+                view = view[chunk_size:]
+                continue
+            n = min(chunk_size - filled, len(view))
+            buffer[filled : filled + n] = view[:n]
+            filled += n
+            view = view[n:]
+            if filled == chunk_size:
+                yield bytes(buffer)
+                filled = 0
+
+    if filled:
+        yield bytes(memoryview(buffer)[:filled])
+
+
+async def split_chunks(blocks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    按部署配置切分数据块。
+
+    chunking 为 "fixed" 时按 chunk_size 定长切分；为 "cdc" 时按内容定义切分，
+    分块大小由 cdc_min_size / cdc_avg_size / cdc_max_size 控制。
+    """
+    if await db.get_cfg("chunking", "fixed") == "cdc":
+        avg_size = await db.get_cfg("cdc_avg_size", 1024 * 1024)
+        chunker = core.chunker.FastCDC(
+            min_size=await db.get_cfg("cdc_min_size", avg_size // 4),
+            avg_size=avg_size,
+            max_size=await db.get_cfg("cdc_max_size", avg_size * 4),
+        )
+        return chunker.split(blocks)
+    return reframe(blocks, await db.get_cfg("chunk_size", 1024 * 1024))
+
+
+class ChunkIngest:
+    """
+    分块写入流水线。
+
+    读取和哈希在前台顺序进行，每攒够 batch_size 个分块就用一次查询完成去重，
+    新分块交给最多 concurrency 个并发上传任务。上传任务占用的槽位直到其所有副本写完才释放，
+    因此内存上限约为 (concurrency + batch_size) * chunk_size。
+
+    存储大小小于 pack_threshold 的分块交给 core.pack.packer 写入打包对象（纠删码模式下不打包），
+    这类分块进入打包缓冲区后就释放槽位，缓冲区的内存由 Packer 限制。
+
+    上传过程中不写数据库，新分块的元数据由 commit() 在文件的事务中批量写入，
+    同时为本文件用到的每个分块增加一次引用计数。上传失败或没有提交时必须调用 abort()，
+    否则已写入存储节点的分块没有任何记录引用，垃圾回收也无法找到它们。
+    """
+
+    def __init__(
+        self,
+        storage_list: List[db.Storage],
+        num_storages: int,
+        quorum: Optional[int],
+        concurrency: int = 4,
+        batch_size: int = 64,
+        codec: Optional[core.erasure.ReedSolomon] = None,
+        compressor: Optional[core.compression.Compressor] = None,
+        pack_threshold: int = 0,
+    ):
+        self.storage_list = storage_list
+        # 纠删码模式下每个分块本身就分散成多个对象，不打包
+        self.pack_threshold = pack_threshold if codec is None else 0
+        self.codec = codec
+        self.compressor = compressor
+        self.num_storages = num_storages
+        self.quorum = quorum
+        self.batch_size = max(1, batch_size)
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._tasks: List[asyncio.Task] = []
+        self._seen: set[str] = set()  # 本次写入中已处理的分块
+        self._window: List[Tuple[str, bytes]] = []  # 待去重的分块
+        self._window_bytes = 0
+        # 新写入的分块：(原始大小, 压缩编码, 存储大小, 写入任务或打包位置)
+        self._new: Dict[
+            str,
+            Tuple[
+                int,
+                str,
+                int,
+                Union[Replication, core.erasure.ErasureWrite, core.pack.PackedChunk],
+            ],
+        ] = {}
+        # 所有开始写入的副本或分片（包括未达到写入法定数的），abort() 时据此清理
+        self._writes: List[Union[Replication, core.erasure.ErasureWrite]] = []
+        # 去重命中的分块和新分块所在的打包对象在提交前可能没有引用，上传期间持有租约
+        self._chunk_lease = core.lease.Lease(db.Chunk)
+        self._pack_lease = core.lease.Lease(db.Pack)
+        self._error: Optional[BaseException] = None
+
+    async def _store(self, chunk: bytes, chunk_hash: str):
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._slots.release()
+
+        size, compression = len(chunk), core.compression.NONE
+        try:
+            if self.compressor is not None:
+                compression, chunk = await core.executor.cpu.run(
+                    self.compressor.compress, chunk
+                )
+            if len(chunk) < self.pack_threshold:
+                # 小分块和其他上传的小分块一起写入打包对象；
+                # 追加到缓冲区后就释放槽位，让同一窗口内能攒下更多分块
+                replication = await core.pack.packer.add(
+                    chunk,
+                    self.storage_list,
+                    self.num_storages,
+                    self.quorum,
+                    queued=release,
+                )
+            else:
+                # 将分块存储到多个驱动
+                replication = await add_chunk(
+                    fp=chunk,
+                    hash=chunk_hash,
+                    storage_list=self.storage_list,
+                    num_storages=self.num_storages,
+                    quorum=self.quorum,
+                    codec=self.codec,
+                    started=self._writes.append,
+                )
+        except BaseException:
+            release()
+            raise
+        # 后台副本写完后才释放槽位，以限制内存占用
+        replication.add_done_callback(release)
+        if isinstance(replication, core.pack.PackedChunk):
+            await self._pack_lease.add([replication.pack_id])
+        self._new[chunk_hash] = (size, compression, len(chunk), replication)
+
+    def _on_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            if self._error is None:
+                self._error = task.exception()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    async def _dispatch(self, window: List[Tuple[str, bytes]]):
+        # 一次查询完成整批分块的去重
+        hashes = [h for h, _ in window]
+        existing = set(
+            await db.Chunk.filter(hash__in=hashes).values_list("hash", flat=True)
+        )
+        # 命中的分块可能是孤立分块，或在提交前被删除文件释放，持有租约直到提交
+        await self._chunk_lease.add(existing)
+        for chunk_hash, chunk in window:
+            if chunk_hash in existing:
+                continue
+            await self._slots.acquire()
+            if self._error is not None:
+                self._slots.release()
+                self._check()
+            task = asyncio.create_task(self._store(chunk, chunk_hash))
+            task.add_done_callback(self._on_done)
+            self._tasks.append(task)
+
+    def _cancel(self):
+        for task in self._tasks:
+            task.cancel()
+        for *_, replication in self._new.values():
+            replication.cancel()
+
+    async def feed(self, chunks: AsyncIterator[bytes]) -> Tuple[List[str], List[int]]:
+        """
+        读取并哈希一个文件的全部分块，新分块攒满去重窗口后上传。
+
+        未满的窗口留给下一个文件或 finish()，批量上传多个文件时所有文件共用去重窗口，
+        文件之间重复的分块也只写一次。
+
+        :param chunks: 按顺序产出分块数据的异步迭代器
+        :return: (按顺序排列的分块哈希, 对应的分块大小)
+        """
+        hashes: List[str] = []
+        sizes: List[int] = []
+        try:
+            async for chunk in chunks:
+                self._check()
+                chunk_hash = await hash_chunk(chunk)
+                hashes.append(chunk_hash)
+                sizes.append(len(chunk))
+                if chunk_hash in self._seen:  # 重复的分块只写一次
+                    continue
+                self._seen.add(chunk_hash)
+
+                self._window.append((chunk_hash, chunk))
+                self._window_bytes += len(chunk)
+                if (
+                    len(self._window) >= self.batch_size
+                    or self._window_bytes >= BATCH_BYTES
+                ):
+                    await self._flush()
+        except BaseException:
+            self._cancel()
+            raise
+        return hashes, sizes
+
+    async def _flush(self):
+        window, self._window, self._window_bytes = self._window, [], 0
+        if window:
+            await self._dispatch(window)
+
+    async def finish(self):
+        """处理剩余的窗口，返回时每个新分块都已达到写入法定数"""
+        try:
+            await self._flush()
+            await asyncio.gather(*self._tasks)
+        except BaseException:
+            self._cancel()
+            raise
+
+    async def run(self, chunks: AsyncIterator[bytes]) -> Tuple[List[str], List[int]]:
+        """
+        写入一个文件的全部分块，返回时每个新分块都已达到写入法定数。
+
+        :param chunks: 按顺序产出分块数据的异步迭代器
+        :return: (按顺序排列的分块哈希, 对应的分块大小)
+        """
+        hashes, sizes = await self.feed(chunks)
+        await self.finish()
+        return hashes, sizes
+
+    async def commit(self, using_db=None, refs: Optional[Dict[str, int]] = None):
+        """
+        批量写入新分块及其存储节点关联并增加引用计数，应在文件元数据所在的事务中调用。
+
+        :param refs: 每个分块增加的引用计数（引用它的文件数），为空时每个分块加 1
+        :raises ChunkCollectedError: 去重命中的分块已被垃圾回收
+        """
+        await self._create_chunks(using_db)
+
+        if refs is None:
+            refs = dict.fromkeys(self._seen, 1)
+        groups: Dict[int, List[str]] = {}
+        for chunk_hash, count in refs.items():
+            groups.setdefault(count, []).append(chunk_hash)
+        updated = 0
+        for count, hashes in groups.items():
+            for i in range(0, len(hashes), REFCOUNT_BATCH):
+                updated += (
+                    await db.Chunk.filter(hash__in=hashes[i : i + REFCOUNT_BATCH])
+                    .using_db(using_db)
+                    .update(refcount=F("refcount") + count)
+                )
+        if updated != len(refs):
+            raise ChunkCollectedError(
+                "Chunk was garbage collected during upload, please retry"
+            )
+
+    async def _create_chunks(self, using_db=None):
+        if not self._new:
+            return
+        ec_data, ec_parity = (self.codec.k, self.codec.m) if self.codec else (0, 0)
+        packed = {
+            chunk_hash: replication
+            for chunk_hash, (*_, replication) in self._new.items()
+            if isinstance(replication, core.pack.PackedChunk)
+        }
+        await db.Chunk.bulk_create(
+            [
+                db.Chunk(
+                    hash=chunk_hash,
+                    size=size / 1024,
+                    ec_data=ec_data,
+                    ec_parity=ec_parity,
+                    codec=compression,
+                    stored_size=stored_size,
+                    pack_id=(
+                        packed[chunk_hash].pack_id if chunk_hash in packed else None
+                    ),
+                    pack_offset=(
+                        packed[chunk_hash].offset if chunk_hash in packed else None
+                    ),
+                )
+                for chunk_hash, (size, compression, stored_size, _) in self._new.items()
+            ],
+            ignore_conflicts=True,
+            using_db=using_db,
+        )
+        await core.pack.add_live(packed, using_db=using_db)
+        if self.codec is not None:
+            # 并发上传同一个新分块时只保留先提交者的分片，落选的分片由 link_stragglers() 删除
+            await db.Shard.bulk_create(
+                [
+                    db.Shard(chunk_id=chunk_hash, index=index, storage=storage)
+                    for chunk_hash, (*_, replication) in self._new.items()
+                    for index, storage in replication.acked
+                ],
+                ignore_conflicts=True,
+                using_db=using_db,
+            )
+            return
+        # 只关联实际写入成功的 Storage
+        await db.bulk_add_m2m(
+            db.Chunk,
+            "storages",
+            [
+                (chunk_hash, storage.id)
+                for chunk_hash, (*_, replication) in self._new.items()
+                if chunk_hash not in packed
+                for storage in replication.acked  # type: ignore
+            ],
+            using_db=using_db,
+        )
+
+    def link_stragglers(self):
+        """事务提交后调用：后台副本写完后再关联到分块，并删除没有被记录的分片"""
+        self._release_leases()
+        for *_, replication in self._new.values():
+            replication.link_stragglers()
+        if self.codec is not None and self._new:
+            # 纠删码写入没有后台分片，此时已写入的分片都应已记录
+            spawn(self._drop_unrecorded(list(self._writes)))
+
+    def _release_leases(self):
+        self._chunk_lease.release()
+        self._pack_lease.release()
+
+    async def _drop_unrecorded(
+        self, writes: List[Union[Replication, core.erasure.ErasureWrite]]
+    ):
+        """
+        删除写入了存储节点、但没有被任何分块记录引用的对象：
+        并发上传同一分块时落选的分片，以及未达到写入法定数的写入。
+        """
+        objects = []
+        shards = [w for w in writes if isinstance(w, core.erasure.ErasureWrite)]
+        for i in range(0, len(shards), REFCOUNT_BATCH):
+            batch = shards[i : i + REFCOUNT_BATCH]
+            recorded = set(
+                await db.Shard.filter(chunk_id__in=[w.hash for w in batch]).values_list(
+                    "chunk_id", "index", "storage_id"
+                )
+            )
+            objects += [
+                (core.erasure.shard_key(w.hash, index), storage)
+                for w in batch
+                for index, storage in w.stored
+                if (w.hash, index, storage.id) not in recorded
+            ]
+        for write in writes:
+            if isinstance(write, Replication) and write.stored:
+                recorded = set(
+                    await db.Chunk.filter(hash=write.hash).values_list(
+                        "storages__id", flat=True
+                    )
+                )
+                objects += [
+                    (write.hash, s) for s in write.stored if s.id not in recorded
+                ]
+        await core.gc.collector.delete_objects(objects)
+
+    async def abort(self):
+        """
+        放弃提交，上传失败、客户端断开时调用。
+
+        已达到写入法定数的新分块记录为引用计数为 0 的分块，由垃圾回收在宽限期过后删除
+        （其他上传在此期间仍可以去重命中它们）；未达到法定数的写入直接删除已写入的对象。
+        清理在后台任务中进行，调用方再次被取消也会完成。
+        """
+        try:
+            await asyncio.shield(spawn(self._abort()))
+        except Exception as e:
+            print(f"Failed to clean up aborted upload: {e}")
+
+    async def _abort(self):
+        try:
+            self._cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            for write in self._writes:
+                await write.finish()  # 等待被取消的副本写入结束
+            if self._new:
+                async with in_transaction() as conn:
+                    await self._create_chunks(using_db=conn)
+                for *_, replication in self._new.values():
+                    replication.link_stragglers()
+            # 已记录的副本由 link_stragglers() 关联；分片和未达到法定数的写入逐个核对
+            acked = {id(replication) for *_, replication in self._new.values()}
+            await self._drop_unrecorded(
+                [
+                    w
+                    for w in self._writes
+                    if isinstance(w, core.erasure.ErasureWrite) or id(w) not in acked
+                ]
+            )
+        finally:
+            self._release_leases()
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from tortoise.expressions import Case, F, Value, When
+
+LEASE = 600  # 租约时长（秒）
+BATCH = 500  # 每条 UPDATE 语句续约的记录数
+
+
+def lease_end() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=LEASE)
+
+
+def touch(now: datetime):
+    """update_time 的更新表达式：更新为 now，但不缩短尚未到期的租约"""
+    return Case(When(update_time__lt=now, then=Value(now)), default=F("update_time"))
+
+
+async def pin(model, keys: Iterable[str], using_db=None):
+    """
+    把记录的 update_time 推迟到租约结束。
+
+    垃圾回收和压实只处理 update_time 早于宽限期的记录，因此租约期间记录不会被删除，
+    与宽限期长短无关；持有者退出后租约自然过期，之后再经过宽限期才会被回收。
+
+    :param model: Chunk 或 Pack
+    :param keys: 记录主键
+    """
+    keys = list(keys)
+    until = lease_end()
+    for i in range(0, len(keys), BATCH):
+        await (
+            model.filter(pk__in=keys[i : i + BATCH], update_time__lt=until)
+            .using_db(using_db)
+            .update(update_time=until)
+        )
+
+
+class Lease:
+    """
+    上传期间持有的租约：每 LEASE / 3 秒为登记的分块和打包对象续约一次，直到 release()。
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.keys: set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def add(self, keys: Iterable[str]):
+        """登记并立即续约"""
+        keys = set(keys) - self.keys
+        if not keys:
+            return
+        self.keys |= keys
+        await pin(self.model, keys)
+        if self._task is None:
+            self._task = asyncio.create_task(self._renew())
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(LEASE / 3)
+            try:
+                await pin(self.model, self.keys)
+            except Exception as e:
+                print(f"Failed to renew lease: {e}")
+
+    def release(self):
+        """停止续约，已续约的租约到期后记录恢复为可回收"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,105 @@
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Iterable, List, Tuple
+
+import db
+
+DIGEST_SIZE = 16  # xxh3_128 摘要长度（字节）
+
+
+class Manifest:
+    """
+    文件的有序分块清单。
+
+    chunks 为按顺序拼接的 16 字节分块摘要，ends 为每个分块的结束偏移量（累计字节数），
+    通过二分查找可以在 O(log n) 内定位任意字节所在的分块。
+    """
+
+    def __init__(self, chunks: bytes, ends: array):
+        self.chunks = chunks
+        self.ends = ends
+
+    @classmethod
+    def build(cls, hashes: Iterable[str], sizes: Iterable[int]) -> "Manifest":
+        chunks = b"".join(bytes.fromhex(h) for h in hashes)
+        ends = array("Q")
+        total = 0
+        for size in sizes:
+            total += size
+            ends.append(total)
+        return cls(chunks, ends)
+
+    @classmethod
+    def unpack(cls, chunks: bytes, offsets: bytes) -> "Manifest":
+        ends = array("Q")
+        ends.frombytes(offsets)
+        if sys.byteorder == "big":
+            ends.byteswap()
+        return cls(bytes(chunks), ends)
+
+    def pack(self) -> Tuple[bytes, bytes]:
+        ends = array("Q", self.ends)
+        if sys.byteorder == "big":
+            ends.byteswap()
+        return self.chunks, ends.tobytes()
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    @property
+    def size(self) -> int:
+        return self.ends[-1] if self.ends else 0
+
+    def hash_at(self, index: int) -> str:
+        return self.chunks[index * DIGEST_SIZE : (index + 1) * DIGEST_SIZE].hex()
+
+    def hashes(self) -> List[str]:
+        return [self.hash_at(i) for i in range(len(self))]
+
+    def start_of(self, index: int) -> int:
+        return self.ends[index - 1] if index else 0
+
+    def locate(self, offset: int) -> int:
+        """返回包含字节 offset 的分块序号"""
+        return bisect_right(self.ends, offset)
+
+    def span(self, start: int, end: int) -> List[Tuple[str, int, int]]:
+        """
+        将闭区间 [start, end] 映射到分块。
+
+        :return: (分块哈希, 块内起始位置, 块内结束位置) 列表，结束位置不包含
+        """
+        parts = []
+        index = self.locate(start)
+        while index < len(self) and self.start_of(index) <= end:
+            chunk_start = self.start_of(index)
+            lo = max(start - chunk_start, 0)
+            hi = min(end + 1, self.ends[index]) - chunk_start
+            parts.append((self.hash_at(index), lo, hi))
+            index += 1
+        return parts
+
+
+async def save(file_hash: str, manifest: Manifest, using_db=None):
+    chunks, offsets = manifest.pack()
+    await db.FileManifest.update_or_create(
+        hash=file_hash,
+        defaults={"chunks": chunks, "offsets": offsets},
+        using_db=using_db,
+    )
+
+
+async def save_many(manifests: List[Tuple[str, Manifest]], using_db=None):
+    """批量保存新文件的分块清单"""
+    rows = []
+    for file_hash, manifest in manifests:
+        chunks, offsets = manifest.pack()
+        rows.append(db.FileManifest(hash=file_hash, chunks=chunks, offsets=offsets))
+    await db.FileManifest.bulk_create(rows, using_db=using_db)
+
+
+async def load(file: db.File) -> Manifest:
+    """读取文件的分块清单，一次查询"""
+    row = await db.FileManifest.get(hash=file.hash)
+    return Manifest.unpack(row.chunks, row.offsets)
@@ -0,0 +1,324 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+import core.pagination
+import db
+
+MAX_NAME = 1024  # 单个路径分量的最大长度
+
+
+class NamespaceError(ValueError):
+    pass
+
+
+class PathNotFound(NamespaceError):
+    pass
+
+
+class PathExists(NamespaceError):
+    pass
+
+
+class InvalidPath(NamespaceError):
+    pass
+
+
+class DirectoryNotEmpty(NamespaceError):
+    pass
+
+
+_root_id: Optional[int] = None
+
+
+def split(path: str) -> List[str]:
+    """
+    把路径拆分为分量，忽略多余的斜杠和 "."。
+
+    :raises InvalidPath: 包含 ".." 或过长的分量
+    """
+    parts = [part for part in path.split("/") if part not in ("", ".")]
+    for part in parts:
+        if part == ".." or len(part) > MAX_NAME:
+            raise InvalidPath(f"Invalid path component {part[:64]!r}")
+    return parts
+
+
+def join(directory: str, name: str) -> str:
+    return f"{directory}/{name}" if directory else name
+
+
+async def root_id() -> int:
+    """根目录 ID；多个进程同时初始化时可能建出多个根目录，统一取最小的一个"""
+    global _root_id
+    if _root_id is None:
+        root = await db.Directory.filter(parent_id=None).order_by("id").first()
+        if root is None:
+            root = await db.Directory.create(parent_id=None, name="")
+        _root_id = root.id
+    return _root_id
+
+
+async def lookup_dir(parts: List[str], using_db=None) -> Optional[db.Directory]:
+    """逐级查找目录，不存在时返回 None"""
+    directory = await db.Directory.get(id=await root_id(), using_db=using_db)
+    for name in parts:
+        directory = await db.Directory.get_or_none(
+            parent_id=directory.id, name=name, using_db=using_db
+        )
+        if directory is None:
+            return None
+    return directory
+
+
+async def lookup_file(path: str, using_db=None) -> Optional[db.File]:
+    parts = split(path)
+    if not parts:
+        return None
+    directory = await lookup_dir(parts[:-1], using_db=using_db)
+    if directory is None:
+        return None
+    return await db.File.get_or_none(
+        directory_id=directory.id, name=parts[-1], using_db=using_db
+    )
+
+
+async def ancestors(dir_id: int, using_db=None) -> List[int]:
+    """:return: 从 dir_id 自身到根目录的目录 ID 列表"""
+    chain = []
+    current: Optional[int] = dir_id
+    while current is not None:
+        chain.append(current)
+        current = (
+            await db.Directory.filter(id=current)
+            .using_db(using_db)
+            .first()
+            .values_list("parent_id", flat=True)
+        )
+    return chain
+
+
+async def _adjust(dir_ids: Iterable[int], files: int, dirs: int, size: float, using_db):
+    dir_ids = list(dir_ids)
+    if not dir_ids or not (files or dirs or size):
+        return
+    await (
+        db.Directory.filter(id__in=dir_ids)
+        .using_db(using_db)
+        .update(
+            file_count=F("file_count") + files,
+            dir_count=F("dir_count") + dirs,
+            size=F("size") + size,
+        )
+    )
+
+
+async def adjust(
+    dir_id: int, files: int = 0, dirs: int = 0, size: float = 0, using_db=None
+):
+    """
+    更新目录及其所有上级目录的汇总数据，应在修改目录内容的事务中调用。
+
+    :param files: 文件数变化
+    :param dirs: 子目录数变化
+    :param size: 文件总大小变化 (KB)
+    """
+    await _adjust(await ancestors(dir_id, using_db), files, dirs, size, using_db)
+
+
+async def mkdirs(parts: List[str], using_db=None) -> int:
+    """
+    逐级创建目录（已存在的目录直接使用），并更新上级目录的子目录数。
+
+    在事务中调用时，using_db 应为当前所在的事务。
+
+    :return: 最后一级目录的 ID
+    """
+    dir_id = await root_id()
+    for name in parts:
+        directory = await db.Directory.get_or_none(
+            parent_id=dir_id, name=name, using_db=using_db
+        )
+        if directory is None:
+            try:
+                # 在保存点中插入，唯一约束冲突只回滚这一条插入，不影响调用方的事务
+                async with in_transaction() as savepoint:
+                    directory = await db.Directory.create(
+                        parent_id=dir_id, name=name, using_db=savepoint
+                    )
+            except IntegrityError:
+                # 其他请求同时创建了同名目录
+                directory = await db.Directory.get(
+                    parent_id=dir_id, name=name, using_db=using_db
+                )
+            else:
+                await adjust(dir_id, dirs=1, using_db=using_db)
+        dir_id = directory.id
+    return dir_id
+
+
+async def paths(dir_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    批量计算目录的完整路径，每一层只查询一次。
+
+    :return: {目录 ID: 路径}，根目录的路径为空字符串
+    """
+    rows: Dict[int, Tuple[Optional[int], str]] = {}
+    pending = set(dir_ids)
+    while pending:
+        found = await db.Directory.filter(id__in=list(pending)).values_list(
+            "id", "parent_id", "name"
+        )
+        pending = set()
+        for dir_id, parent_id, name in found:
+            rows[dir_id] = (parent_id, name)
+            if parent_id is not None and parent_id not in rows:
+                pending.add(parent_id)
+
+    resolved: Dict[int, str] = {}
+
+    def resolve(dir_id: int) -> str:
+        if dir_id not in resolved:
+            parent_id, name = rows[dir_id]
+            resolved[dir_id] = (
+                "" if parent_id is None else join(resolve(parent_id), name)
+            )
+        return resolved[dir_id]
+
+    for dir_id in rows:
+        resolve(dir_id)
+    return resolved
+
+
+async def file_paths(files: List[db.File]) -> Dict[str, str]:
+    """:return: {文件哈希: 完整路径}"""
+    dirs = await paths({file.directory_id for file in files})  # type: ignore
+    return {file.hash: join(dirs[file.directory_id], file.name) for file in files}  # type: ignore
+
+
+def encode_cursor(kind: str, name: Optional[str]) -> str:
+    return core.pagination.encode_cursor([kind, name])
+
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[str, Optional[str]]:
+    if not cursor:
+        return "d", None
+    try:
+        kind, name = core.pagination.decode_cursor(cursor)
+    except (core.pagination.InvalidCursor, TypeError, ValueError):
+        raise InvalidPath("Invalid cursor")
+    if kind not in ("d", "f"):
+        raise InvalidPath("Invalid cursor")
+    return kind, name
+
+
+async def list_dir(
+    dir_id: int, cursor: Optional[str] = None, limit: int = 100
+) -> Tuple[List[db.Directory], List[db.File], Optional[str]]:
+    """
+    列出目录的直接子项：先按名称列出子目录，再按名称列出文件。
+
+    按 (上级目录, 名称) 索引做范围查询，耗时只与本页条目数有关。
+
+    :param cursor: 上一页返回的游标，为空表示从头开始
+    :param limit: 每页条目数，限制在 1 到 core.pagination.MAX_LIMIT 之间
+    :return: (子目录, 文件, 下一页游标)，没有下一页时游标为 None
+    """
+    limit = core.pagination.clamp(limit)
+    kind, after = decode_cursor(cursor)
+    dirs: List[db.Directory] = []
+    if kind == "d":
+        query = db.Directory.filter(parent_id=dir_id)
+        if after is not None:
+            query = query.filter(name__gt=after)
+        dirs = await query.order_by("name").limit(limit + 1)
+        if len(dirs) > limit:
+            return dirs[:limit], [], encode_cursor("d", dirs[limit - 1].name)
+        after = None
+
+    remaining = limit - len(dirs)
+    query = db.File.filter(directory_id=dir_id)
+    if after is not None:
+        query = query.filter(name__gt=after)
+    files = await query.order_by("name").limit(remaining + 1)
+    if len(files) <= remaining:
+        return dirs, files, None
+    files = files[:remaining]
+    return dirs, files, encode_cursor("f", files[-1].name if files else None)
+
+
+async def move(src: str, dst: str) -> str:
+    """
+    原子地重命名或移动文件或目录，目标的上级目录不存在时自动创建。
+
+    移动目录只修改目录自身一行，以及新旧上级目录链上的汇总数据，与子树大小无关。
+
+    :return: "file" 或 "directory"
+    """
+    src_parts, dst_parts = split(src), split(dst)
+    if not src_parts or not dst_parts:
+        raise InvalidPath("Cannot move the root directory")
+
+    async with in_transaction() as conn:
+        file = await lookup_file(src, using_db=conn)
+        directory = (
+            None if file is not None else await lookup_dir(src_parts, using_db=conn)
+        )
+        if file is None and directory is None:
+            raise PathNotFound(f"{src} not found")
+
+        parent_id = await mkdirs(dst_parts[:-1], using_db=conn)
+        name = dst_parts[-1]
+        new_chain = await ancestors(parent_id, using_db=conn)
+
+        if file is not None:
+            if await db.File.exists(directory_id=parent_id, name=name, using_db=conn):
+                raise PathExists(f"{dst} already exists")
+            old_chain = await ancestors(file.directory_id, using_db=conn)  # type: ignore
+            await db.File.filter(hash=file.hash).using_db(conn).update(
+                directory_id=parent_id, name=name
+            )
+            files, dirs, size = 1, 0, file.size
+        else:
+            if directory.id in new_chain:  # type: ignore
+                raise InvalidPath("Cannot move a directory into itself")
+            if await db.Directory.exists(parent_id=parent_id, name=name, using_db=conn):
+                raise PathExists(f"{dst} already exists")
+            old_chain = await ancestors(directory.parent_id, using_db=conn)  # type: ignore
+            await db.Directory.filter(id=directory.id).using_db(conn).update(  # type: ignore
+                parent_id=parent_id, name=name
+            )
+            files = directory.file_count  # type: ignore
+            dirs = directory.dir_count + 1  # type: ignore
+            size = directory.size  # type: ignore
+
+        # 新旧路径共同的上级目录汇总不变
+        common = set(old_chain) & set(new_chain)
+        await _adjust(
+            [i for i in old_chain if i not in common], -files, -dirs, -size, conn
+        )
+        await _adjust(
+            [i for i in new_chain if i not in common], files, dirs, size, conn
+        )
+    return "file" if file is not None else "directory"
+
+
+async def rmdir(path: str):
+    """删除空目录"""
+    parts = split(path)
+    if not parts:
+        raise InvalidPath("Cannot remove the root directory")
+    async with in_transaction() as conn:
+        directory = await lookup_dir(parts, using_db=conn)
+        if directory is None:
+            raise PathNotFound(f"{path} not found")
+        deleted = (
+            await db.Directory.filter(id=directory.id, file_count=0, dir_count=0)
+            .using_db(conn)
+            .delete()
+        )
+        if not deleted:
+            raise DirectoryNotEmpty(f"{path} is not empty")
+        await adjust(directory.parent_id, dirs=-1, using_db=conn)  # type: ignore
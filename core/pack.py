@@ -0,0 +1,318 @@
+import asyncio
+import secrets
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+import core.lease
+import core.scheduler
+import db
+import drivers
+from core.replication import Replication
+
+COMPACT_BATCH = 16  # 每轮压实的打包对象数
+MAX_FLUSHES = 4  # 同时写入的打包对象数上限，超过后新的分块等待
+
+# 尚未结束的打包写入任务，关闭时等待其完成
+_background: set[asyncio.Task] = set()
+
+
+def pack_key() -> str:
+    return f"pack-{secrets.token_hex(16)}"
+
+
+class PackedChunk:
+    """
+    写入打包对象的分块。
+
+    提供与 Replication 相同的 add_done_callback / link_stragglers / cancel 接口，
+    供 ChunkIngest 统一处理；副本由所在的打包对象管理。
+    """
+
+    def __init__(self, pack_id: str, offset: int):
+        self.pack_id = pack_id
+        self.offset = offset
+
+    def add_done_callback(self, callback: Callable[[], None]):
+        callback()  # 数据已交给 Packer，不再占用上传槽位（通常已由 queued 释放）
+
+    def link_stragglers(self):
+        pass
+
+    def cancel(self):
+        pass
+
+
+class _Batch:
+    def __init__(self, storage_list: List[db.Storage], num_storages: int, quorum: int):
+        self.storage_list = storage_list
+        self.num_storages = num_storages
+        self.quorum = quorum
+        self.blocks: List[bytes] = []
+        self.size = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def append(self, data: bytes) -> int:
+        offset = self.size
+        self.blocks.append(data)
+        self.size += len(data)
+        return offset
+
+
+async def _write_pack(
+    data: bytes, storage_list: List[db.Storage], num_storages: int, quorum: int
+) -> Tuple[str, Replication]:
+    """
+    把打包对象写入存储节点并创建 Pack 记录，达到 quorum 个副本后返回。
+
+    新对象的存活字节数为 0，直到上传提交时才计入其中的分块，因此创建时就持有租约，
+    由写入分块的上传续约，避免上传时间超过宽限期时被垃圾回收。
+    """
+    pack_id = pack_key()
+    replication = Replication(
+        data, pack_id, storage_list, num_storages, quorum, model=db.Pack
+    )
+    await replication.wait()
+    async with in_transaction() as conn:
+        await db.Pack.create(id=pack_id, size=len(data), using_db=conn)
+        await core.lease.pin(db.Pack, [pack_id], using_db=conn)
+        await db.bulk_add_m2m(
+            db.Pack,
+            "storages",
+            [(pack_id, storage.id) for storage in replication.acked],
+            using_db=conn,
+        )
+    return pack_id, replication
+
+
+class Packer:
+    """
+    小分块的组提交写入器。
+
+    同一时间窗口（pack_delay 秒）内各个上传提交的小分块依次追加到同一个缓冲区，
+    缓冲区达到 pack_size 或窗口结束时作为一个打包对象写入，所有等待者一起返回。
+    打包对象按普通分块的方式写入 num_storages 个存储节点，分块只记录所在对象和偏移量，
+    因此小文件不再为每个分块在每个存储节点上产生一个对象。
+    """
+
+    def __init__(self):
+        self._open: Dict[tuple, _Batch] = {}
+        self.packs = 0  # 写入的打包对象数
+        self.packed = 0  # 打包写入的分块数
+
+    async def add(
+        self,
+        data: bytes,
+        storage_list: List[db.Storage],
+        num_storages: int,
+        quorum: Optional[int] = None,
+        queued: Optional[Callable[[], None]] = None,
+    ) -> PackedChunk:
+        """
+        把分块追加到当前打包对象，打包对象达到写入法定数后返回。
+
+        :param data: 实际存储的分块数据（已压缩）
+        :param queued: 分块追加到缓冲区后立即调用，调用方可以据此提前释放上传槽位
+        """
+        # 正在写入的打包对象过多时等待，限制缓冲在内存中的数据量
+        while len(_background) >= MAX_FLUSHES:
+            await asyncio.wait(set(_background), return_when=asyncio.FIRST_COMPLETED)
+        if quorum is None:
+            quorum = num_storages // 2 + 1
+        pack_size = await db.get_cfg("pack_size", 32 * 1024 * 1024)
+        key = (tuple(sorted(s.id for s in storage_list)), num_storages, quorum)
+
+        batch = self._open.get(key)
+        if batch is not None and batch.size + len(data) > pack_size:
+            self._seal(key, batch)
+            batch = None
+        if batch is None:
+            batch = self._open[key] = _Batch(storage_list, num_storages, quorum)
+            batch.timer = asyncio.get_running_loop().call_later(
+                await db.get_cfg("pack_delay", 0.05), self._seal, key, batch
+            )
+        offset = batch.append(data)
+        if batch.size >= pack_size:
+            self._seal(key, batch)
+        if queued is not None:
+            queued()
+
+        # 取消一个上传不影响同一打包对象中的其他分块
+        pack_id = await asyncio.shield(batch.done)
+        self.packed += 1
+        return PackedChunk(pack_id, offset)
+
+    def _seal(self, key: tuple, batch: _Batch):
+        if self._open.get(key) is not batch:
+            return
+        del self._open[key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.create_task(self._flush(batch))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    async def _flush(self, batch: _Batch):
+        data = b"".join(batch.blocks)
+        batch.blocks.clear()
+        try:
+            pack_id, replication = await _write_pack(
+                data, batch.storage_list, batch.num_storages, batch.quorum
+            )
+        except BaseException as e:
+            batch.done.set_exception(e)
+            batch.done.exception()  # 没有等待者时不产生警告
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        self.packs += 1
+        batch.done.set_result(pack_id)
+        replication.link_stragglers()
+
+    def stats(self) -> dict:
+        return {"packs": self.packs, "packed": self.packed}
+
+
+async def add_live(chunks: Dict[str, PackedChunk], using_db=None):
+    """
+    把新建分块的字节数计入所在打包对象的存活字节数，应在创建分块的事务中调用。
+
+    并发上传相同分块时只有一个上传的 Chunk 记录会被创建，另一个打包对象中的副本不计入。
+    """
+    if not chunks:
+        return
+    rows = (
+        await db.Chunk.filter(hash__in=list(chunks))
+        .using_db(using_db)
+        .values_list("hash", "pack_id", "stored_size")
+    )
+    live: Dict[str, int] = defaultdict(int)
+    for chunk_hash, pack_id, stored_size in rows:
+        if pack_id == chunks[chunk_hash].pack_id:
+            live[pack_id] += stored_size
+    for pack_id, size in live.items():
+        await db.Pack.filter(id=pack_id).using_db(using_db).update(
+            live=F("live") + size
+        )
+
+
+async def read_pack(pack_id: str) -> bytes:
+    """从保存打包对象的存储节点中读取整个对象"""
+    storages = await db.Storage.filter(packs__id=pack_id, enabled=True)
+
+    async def fetch(storage: db.Storage):
+        async with drivers.registry.use(storage) as driver:
+            return await driver.get_chunk(pack_id)
+
+    return await core.scheduler.reads.read(storages, fetch)
+
+
+async def compact(limit: int = COMPACT_BATCH) -> Tuple[int, int]:
+    """
+    压实打包对象：把存活字节数低于 pack_compact_ratio 的对象中仍被引用的分块重新写入新的打包对象。
+
+    分块的位置在一个事务中带条件地改到新对象（仍位于旧对象中才修改），
+    旧对象的存活字节数相应减少，归零后由垃圾回收在宽限期过后删除，
+    因此压实期间正在读取旧对象的请求不受影响。
+
+    :return: (压实的打包对象数, 移动的分块数)
+    """
+    ratio = await db.get_cfg("pack_compact_ratio", 0.5)
+    pack_size = await db.get_cfg("pack_size", 32 * 1024 * 1024)
+    cutoff = datetime.now(timezone.utc) - timedelta(
+        seconds=await db.get_cfg("gc_grace_period", 3600)
+    )
+    packs = (
+        await db.Pack.filter(
+            live__gt=0, live__lt=F("size") * ratio, update_time__lt=cutoff
+        )
+        .order_by("live")
+        .limit(limit)
+        .values_list("id", "size", "live")
+    )
+    if not packs:
+        return 0, 0
+
+    storage_list = await db.Storage.filter(enabled=True).all()
+    num_storages = await db.get_cfg("num_storages", 3)
+    quorum = await db.get_cfg("write_quorum") or num_storages // 2 + 1
+
+    # (分块哈希, 旧对象, 新偏移量, 存储大小)
+    moves: List[Tuple[str, str, int, int]] = []
+    blocks: List[bytes] = []
+    size = 0
+    compacted = moved = 0
+
+    async def flush():
+        nonlocal blocks, size, moves, moved
+        if not moves:
+            return
+        data = b"".join(blocks)
+        pack_id, replication = await _write_pack(
+            data, storage_list, num_storages, quorum
+        )
+        # 新对象写满所有副本后再迁移分块，冗余度不低于旧对象
+        await replication.finish()
+        replication.link_stragglers()
+        moved += await _relocate(pack_id, moves)
+        moves, blocks, size = [], [], 0
+
+    for pack_id, *_ in packs:
+        try:
+            data = await read_pack(pack_id)
+        except Exception as e:
+            print(f"Failed to read pack {pack_id} for compaction: {e}")
+            continue
+        chunks = await db.Chunk.filter(pack_id=pack_id).values_list(
+            "hash", "pack_offset", "stored_size"
+        )
+        for chunk_hash, offset, stored_size in chunks:
+            if size and size + stored_size > pack_size:
+                await flush()
+            moves.append((chunk_hash, pack_id, size, stored_size))
+            blocks.append(data[offset : offset + stored_size])
+            size += stored_size
+        compacted += 1
+    await flush()
+    return compacted, moved
+
+
+async def _relocate(pack_id: str, moves: Iterable[Tuple[str, str, int, int]]) -> int:
+    """把分块改到新打包对象，并转移存活字节数，返回实际移动的分块数"""
+    moved = 0
+    released: Dict[str, int] = defaultdict(int)
+    now = datetime.now(timezone.utc)
+    async with in_transaction() as conn:
+        for chunk_hash, old, offset, stored_size in moves:
+            updated = (
+                await db.Chunk.filter(hash=chunk_hash, pack_id=old)
+                .using_db(conn)
+                .update(pack_id=pack_id, pack_offset=offset)
+            )
+            if updated:
+                moved += 1
+                released[old] += stored_size
+        for old, size in released.items():
+            await db.Pack.filter(id=old).using_db(conn).update(
+                live=F("live") - size, update_time=core.lease.touch(now)
+            )
+        await db.Pack.filter(id=pack_id).using_db(conn).update(
+            live=F("live") + sum(released.values())
+        )
+    return moved
+
+
+async def drain(timeout: float = 30):
+    """等待正在写入的打包对象完成，超时后取消"""
+    if not _background:
+        return
+    _, pending = await asyncio.wait(set(_background), timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+
+packer = Packer()
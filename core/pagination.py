@@ -0,0 +1,91 @@
+import base64
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+import orjson
+from tortoise.queryset import QuerySet
+
+EXPORT_BATCH = 1000  # 导出时每次查询的行数
+MAX_LIMIT = 1000  # 单页最多返回的行数
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value: Any) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(value)).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Any:
+    """:return: 游标中的值，cursor 为空时返回 None"""
+    if not cursor:
+        return None
+    try:
+        return orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+def clamp(limit: int) -> int:
+    return max(1, min(limit, MAX_LIMIT))
+
+
+async def page(
+    query: QuerySet, key: str, fields: List[str], cursor: Optional[str], limit: int
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    按唯一有序的 key 列做键集分页，只查询 fields 中的列，不构造模型实例。
+
+    每页都是一次 key > 游标 的索引范围查询，耗时与页码无关。
+
+    :param key: 排序键，必须唯一且包含在 fields 中
+    :param cursor: 上一页返回的游标，为空表示第一页
+    :param limit: 每页行数，限制在 1 到 MAX_LIMIT 之间
+    :return: (本页数据, 下一页游标)，没有下一页时游标为 None
+    """
+    limit = clamp(limit)
+    after = decode_cursor(cursor)
+    if after is not None:
+        query = query.filter(**{f"{key}__gt": after})
+    rows = await query.order_by(key).limit(limit + 1).values(*fields)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][key])
+
+
+async def offset_page(
+    query: QuerySet, key: str, fields: List[str], page: int, page_size: int
+) -> List[dict]:
+    """
+    旧的 page/page_size 分页，页码越大越慢。
+
+    保留一个版本供旧客户端过渡，之后移除，新代码请使用 page()。
+    """
+    page_size = clamp(page_size)
+    return (
+        await query.order_by(key)
+        .offset((max(page, 1) - 1) * page_size)
+        .limit(page_size)
+        .values(*fields)
+    )
+
+
+async def scan(
+    query: QuerySet, key: str, fields: List[str], batch: int = EXPORT_BATCH
+) -> AsyncIterator[List[dict]]:
+    """按 key 分批遍历整个查询结果，每批一次索引范围查询"""
+    after = None
+    while True:
+        current = query if after is None else query.filter(**{f"{key}__gt": after})
+        rows = await current.order_by(key).limit(batch).values(*fields)
+        if rows:
+            yield rows
+        if len(rows) < batch:
+            return
+        after = rows[-1][key]
+
+
+def ndjson(rows: List[dict]) -> bytes:
+    """把一批数据编码为 NDJSON，每行一个 JSON 对象"""
+    return b"".join(orjson.dumps(row) + b"\n" for row in rows)
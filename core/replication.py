@@ -0,0 +1,215 @@
+import asyncio
+import random
+from collections import deque
+from typing import Callable, List, Optional
+
+import core.scheduler
+import db
+import drivers
+
+# 仍在后台补齐副本的任务，关闭时等待其完成
+_background: set[asyncio.Task] = set()
+
+
+class ReplicationError(RuntimeError):
+    pass
+
+
+def weighted_order(storage_list: List[db.Storage]) -> List[db.Storage]:
+    """
+    按优先级加权随机排序存储节点（不放回抽样，Efraimidis-Spirakis）。
+
+    优先级越高越可能排在前面；优先级不大于 0 的节点排在最后。
+    """
+
+    def key(storage: db.Storage) -> float:
+        if storage.priority <= 0:
+            return -random.random()
+        return random.random() ** (1 / storage.priority)
+
+    return sorted(storage_list, key=key, reverse=True)
+
+
+def write_order(storage_list: List[db.Storage]) -> List[db.Storage]:
+    """
+    写入候选节点的顺序：未熔断的节点按优先级加权随机排序，
+    熔断中的节点排在最后，只在健康节点不够用时才会尝试。
+    """
+    reads = core.scheduler.reads
+    return weighted_order(
+        [s for s in storage_list if not reads.is_open(s)]
+    ) + weighted_order([s for s in storage_list if reads.is_open(s)])
+
+
+async def upload(storage: db.Storage, data: bytes, hash: str) -> db.Storage:
+    async with core.scheduler.reads.track(storage, timed=False):
+        async with drivers.registry.use(storage) as driver:
+            if driver.streaming:
+                # 按块写入，驱动不必再复制一份完整的分块
+                await driver.write_chunk_from(
+                    drivers.split_blocks(data), hash, len(data)
+                )
+            else:
+                await driver.add_chunk(data=data, hash=hash)
+    return storage
+
+
+class Replication:
+    """
+    将一个分块并发写入 num_storages 个不同的存储节点。
+
+    wait() 在成功写入 quorum 个副本后返回；其余副本继续在后台写入，
+    失败的副本会换用下一个候选节点重试，直到写满 num_storages 个或候选耗尽。
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+        hash: str,
+        storage_list: List[db.Storage],
+        num_storages: int,
+        quorum: int,
+        model=db.Chunk,
+    ):
+        """:param model: 对象对应的记录（Chunk 或 Pack），后台写完的副本关联到该记录"""
+        self.data = data
+        self.model = model
+        self.hash = hash
+        self.candidates = deque(write_order(storage_list))
+        self.target = min(num_storages, len(storage_list))
+        self.quorum = max(1, min(quorum, self.target))
+        self.stored: List[db.Storage] = []  # 已确认写入的节点
+        self.acked: List[db.Storage] = []  # wait() 返回时已确认的节点
+        self.errors: List[BaseException] = []
+        self._tasks: set[asyncio.Task] = set()
+        self._progress = asyncio.Event()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def _spawn(self):
+        storage = self.candidates.popleft()
+        task = asyncio.create_task(upload(storage, self.data, self.hash))
+        task.add_done_callback(self._on_done)
+        self._tasks.add(task)
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            pass
+        elif task.exception() is not None:
+            self.errors.append(task.exception())  # type: ignore
+            # 换用下一个候选节点补齐副本
+            if self.candidates and len(self.stored) + len(self._tasks) < self.target:
+                self._spawn()
+        else:
+            self.stored.append(task.result())
+        if not self._tasks:
+            self.data = b""  # 全部结束后释放分块数据
+            for callback in self._callbacks:
+                callback()
+            self._callbacks.clear()
+        self._progress.set()
+
+    @property
+    def done(self) -> bool:
+        return not self._tasks
+
+    async def wait(self) -> List[db.Storage]:
+        if self.target == 0:
+            raise ReplicationError("No available storage")
+        for _ in range(self.target):
+            self._spawn()
+        try:
+            while len(self.stored) < self.quorum and self._tasks:
+                self._progress.clear()
+                await self._progress.wait()
+        except BaseException:
+            self.cancel()
+            raise
+
+        if len(self.stored) < self.quorum:
+            raise ReplicationError(
+                f"Failed to upload to {self.quorum} storages. Succeeded: {len(self.stored)}"
+            )
+        self.acked = list(self.stored)
+        return self.acked
+
+    async def finish(self) -> List[db.Storage]:
+        while self._tasks:
+            self._progress.clear()
+            await self._progress.wait()
+        return self.stored
+
+    def add_done_callback(self, callback: Callable[[], None]):
+        """所有副本写入结束（成功或失败）后调用 callback"""
+        if self.done:
+            callback()
+        else:
+            self._callbacks.append(callback)
+
+    def cancel(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    def link_stragglers(self):
+        """在后台等待剩余副本写完，并把它们关联到已创建的 Chunk / Pack 记录"""
+        if self.done and len(self.stored) == len(self.acked):
+            return
+        spawn(self._link_stragglers())
+
+    async def _link_stragglers(self):
+        await self.finish()
+        late = [s for s in self.stored if s not in self.acked]
+        if not late:
+            return
+        record = await self.model.get_or_none(pk=self.hash)
+        if record is not None:
+            await record.storages.add(*late)
+
+
+async def add_chunk(
+    fp: bytes,
+    hash: str,
+    storage_list,
+    num_storages: int,
+    quorum=None,
+    codec=None,
+    started=None,
+):
+    """
+    并发写入分块副本，达到 quorum 个副本后返回，其余副本在后台继续写入。
+    指定 codec 时改为写入纠删码分片，num_storages 和 quorum 不再生效。
+
+    :param started: 写入开始前以写入任务为参数调用，写入失败时调用方可以据此清理已写入的对象
+    :return: Replication，acked 为已确认写入的存储节点；
+             或 core.erasure.ErasureWrite，acked 为 (分片序号, 存储节点) 列表
+    :raises ReplicationError: 未能写满 quorum 个副本或足够的分片
+    """
+    if codec is not None:
+        import core.erasure  # core.erasure 依赖本模块，在此导入以避免循环导入
+
+        replication = core.erasure.ErasureWrite(fp, hash, storage_list, codec)
+    else:
+        if quorum is None:
+            quorum = num_storages // 2 + 1
+        replication = Replication(fp, hash, storage_list, num_storages, quorum)
+    if started is not None:
+        started(replication)
+    await replication.wait()
+    return replication
+
+
+def spawn(coro) -> asyncio.Task:
+    """在后台运行 coro，进程关闭时由 drain() 等待"""
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+async def drain(timeout: float = 30):
+    """等待后台副本写入完成，超时后取消"""
+    if not _background:
+        return
+    _, pending = await asyncio.wait(set(_background), timeout=timeout)
+    for task in pending:
+        task.cancel()
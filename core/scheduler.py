@@ -0,0 +1,277 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import db
+from db import conf
+
+T = TypeVar("T")
+
+
+class StorageStats:
+    """单个存储节点的读取延迟和错误统计"""
+
+    ALPHA = 0.2  # 延迟 EWMA 的平滑系数
+    ERROR_ALPHA = 0.1  # 错误率 EWMA 的平滑系数
+
+    def __init__(self, window: int = 128):
+        self.latency: Optional[float] = None  # 延迟 EWMA（秒）
+        self.error_rate = 0.0
+        self.samples: deque = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0  # 连续失败次数
+        self.open_until = 0.0  # 熔断截止时间
+
+    def record(self, latency: Optional[float], ok: bool):
+        """:param latency: 请求耗时（秒），为 None 时只统计结果（如写入和健康探测）"""
+        self.requests += 1
+        if latency is not None:
+            self.samples.append(latency)
+        if ok:
+            if latency is not None:
+                self.latency = (
+                    latency
+                    if self.latency is None
+                    else self.latency + self.ALPHA * (latency - self.latency)
+                )
+            self.failures = 0
+        else:
+            self.errors += 1
+            self.failures += 1
+        self.error_rate += self.ERROR_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def record_slower_than(self, elapsed: float):
+        """
+        请求被对冲取消时只知道耗时不少于 elapsed：不计入样本和结果，
+        只在延迟 EWMA 低于 elapsed 时向其靠拢，使总是输给对冲的慢节点不会一直排在前面。
+        """
+        if self.latency is None or elapsed > self.latency:
+            self.latency = (
+                elapsed
+                if self.latency is None
+                else self.latency + self.ALPHA * (elapsed - self.latency)
+            )
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.samples) < 8:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class ReadScheduler:
+    """
+    按延迟选择副本的读取调度器。
+
+    每个存储节点维护延迟 EWMA、最近延迟样本和错误率，读取时优先选择得分最低（最快且健康）的副本，
+    得分相同时优先级高者优先。首个请求超过该节点 p95 延迟仍未返回时向下一个副本发出对冲请求，
+    先返回者胜出，另一个请求被取消。连续失败 circuit_failures 次的节点熔断 circuit_cooldown 秒，
+    到期后放行一次试探，成功则恢复。
+    """
+
+    def __init__(
+        self,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.01,
+        circuit_failures: int = 5,
+        circuit_cooldown: float = 30,
+    ):
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.circuit_failures = circuit_failures
+        self.circuit_cooldown = circuit_cooldown
+        self.stats: Dict[int, StorageStats] = {}
+        self.hedged = 0  # 发出的对冲请求数
+        self.hedge_wins = 0  # 对冲请求先返回的次数
+
+    def _stats(self, storage: db.Storage) -> StorageStats:
+        stats = self.stats.get(storage.id)
+        if stats is None:
+            stats = self.stats[storage.id] = StorageStats()
+        return stats
+
+    def available(self, storage: db.Storage) -> bool:
+        """
+        节点是否未被熔断；熔断到期后放行一次试探，并重新计时。
+
+        只应在实际向节点发出请求时调用，排序等只读判断使用 is_open()。
+        """
+        stats = self._stats(storage)
+        if stats.failures < self.circuit_failures:
+            return True
+        now = time.monotonic()
+        if now < stats.open_until:
+            return False
+        stats.open_until = now + self.circuit_cooldown
+        return True
+
+    def is_open(self, storage: db.Storage) -> bool:
+        """节点当前是否处于熔断状态（不消耗试探机会）"""
+        stats = self._stats(storage)
+        return (
+            stats.failures >= self.circuit_failures
+            and time.monotonic() < stats.open_until
+        )
+
+    def record(self, storage: db.Storage, latency: Optional[float], ok: bool):
+        stats = self._stats(storage)
+        stats.record(latency, ok)
+        if not ok and stats.failures >= self.circuit_failures:
+            stats.open_until = time.monotonic() + self.circuit_cooldown
+
+    def score(self, storage: db.Storage) -> float:
+        stats = self._stats(storage)
+        # 没有样本的节点按已知最快节点估计，使其有机会被探测
+        latency = stats.latency
+        if latency is None:
+            known = [s.latency for s in self.stats.values() if s.latency is not None]
+            latency = min(known) if known else 0.0
+        return latency * (1 + 4 * stats.error_rate)
+
+    def order(self, storages: List[db.Storage]) -> List[db.Storage]:
+        """
+        按得分排序副本，已熔断的节点排在最后。
+
+        得分相近（10% 以内）的节点随机排列，避免所有请求都压在同一个节点上。
+        """
+        available = [s for s in storages if not self.is_open(s)]
+        broken = [s for s in storages if s not in available]
+        available.sort(
+            key=lambda s: (
+                self.score(s) * (1 + 0.1 * random.random()),
+                -s.priority,
+            )
+        )
+        return available + broken
+
+    def hedge_delay(self, storage: db.Storage) -> float:
+        stats = self._stats(storage)
+        delay = stats.quantile(self.hedge_quantile)
+        if delay is None:
+            delay = stats.latency * 2 if stats.latency is not None else 0.1
+        return max(delay, self.hedge_min_delay)
+
+    @asynccontextmanager
+    async def track(self, storage: db.Storage, timed: bool = True):
+        """
+        记录一次请求的延迟和结果。
+
+        被取消的请求不做任何记录（耗时被截断，不代表节点的真实延迟）；
+        FileNotFoundError 说明节点正常响应，只计为成功，不计入延迟。
+
+        :param timed: 是否计入读取延迟，写入等耗时与读取不可比的请求只统计结果
+        """
+        start = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except FileNotFoundError:
+            self.record(storage, None, True)
+            raise
+        except Exception:
+            self.record(storage, time.monotonic() - start if timed else None, False)
+            raise
+        self.record(storage, time.monotonic() - start if timed else None, True)
+
+    async def _attempt(
+        self, storage: db.Storage, fetch: Callable[[db.Storage], Awaitable[T]]
+    ) -> T:
+        async with self.track(storage):
+            return await fetch(storage)
+
+    async def read(
+        self,
+        storages: List[db.Storage],
+        fetch: Callable[[db.Storage], Awaitable[T]],
+    ) -> T:
+        """
+        从多个副本中读取一份数据。
+
+        :param fetch: 从指定存储节点读取数据的协程函数
+        :raises: 所有副本都读取失败时抛出最后一个异常
+        """
+        pending = deque(self.order(storages))
+        if not pending:
+            raise FileNotFoundError("No storage holds the chunk")
+        running: Dict[asyncio.Task, db.Storage] = {}
+        started: Dict[asyncio.Task, float] = {}
+        last_error: Optional[BaseException] = None
+        hedged = False
+
+        def spawn():
+            storage = pending.popleft()
+            self.available(storage)  # 发往熔断到期节点的请求即为试探，重新计时
+            task = asyncio.create_task(self._attempt(storage, fetch))
+            running[task] = storage
+            started[task] = time.monotonic()
+
+        spawn()
+        first = next(iter(running))
+        try:
+            while running:
+                timeout = None
+                if not hedged and pending:
+                    timeout = self.hedge_delay(next(iter(running.values())))
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 首个请求超过 p95 延迟，向下一个副本发出对冲请求
+                    hedged = True
+                    self.hedged += 1
+                    spawn()
+                    continue
+                for task in done:
+                    running.pop(task)
+                    if task.exception() is None:
+                        if task is not first and hedged:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                if not running and pending:
+                    spawn()
+        finally:
+            now = time.monotonic()
+            for task, storage in running.items():
+                task.cancel()
+                if hedged:
+                    # 输给对冲的请求至少耗时这么久
+                    self._stats(storage).record_slower_than(now - started[task])
+        raise last_error  # type: ignore
+
+    def snapshot(self) -> dict:
+        return {
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "storages": {
+                storage_id: {
+                    "latency_ms": (
+                        stats.latency * 1000 if stats.latency is not None else None
+                    ),
+                    "p95_ms": (
+                        stats.quantile(0.95) * 1000
+                        if stats.quantile(0.95) is not None
+                        else None
+                    ),
+                    "error_rate": stats.error_rate,
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "failures": stats.failures,
+                    "circuit_open": stats.failures >= self.circuit_failures,
+                }
+                for storage_id, stats in self.stats.items()
+            },
+        }
+
+
+reads = ReadScheduler(
+    hedge_quantile=conf.READ_HEDGE_QUANTILE,
+    hedge_min_delay=conf.READ_HEDGE_MIN_DELAY,
+    circuit_failures=conf.CIRCUIT_FAILURES,
+    circuit_cooldown=conf.CIRCUIT_COOLDOWN,
+)
@@ -0,0 +1,148 @@
+import mmap
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+import core.compression
+import core.scheduler
+import db
+import drivers
+from db import conf
+
+ZEROCOPY = "http.response.zerocopysend"
+MMAP_BLOCK = 256 * 1024  # mmap 回退时每次交给传输层的字节数
+LOOKUP_BATCH = 500  # 每次查询的分块数
+
+Segment = Tuple[str, int, int]  # (文件路径, 起始偏移, 字节数)
+
+
+async def _local_storages() -> Dict[int, db.Storage]:
+    """启用、未熔断且位于本机磁盘上的存储节点，按 id 索引"""
+    return {
+        storage.id: storage
+        for storage in await db.Storage.filter(enabled=True).all()
+        if not drivers.drivers[storage.driver].remote
+        and not core.scheduler.reads.is_open(storage)
+    }
+
+
+async def local_segments(
+    parts: Sequence[Tuple[str, int, int]],
+) -> Optional[List[Segment]]:
+    """
+    把 Manifest.span() 的结果映射到本地存储节点上的分块文件。
+
+    只有未压缩、非纠删码、且位于启用的本地存储节点上的分块可以直接发送文件；
+    按顺序分批查询，遇到第一个不满足条件的分块即返回 None，由调用方走普通的读取路径。
+    """
+    if not conf.SENDFILE or not parts:
+        return None
+    storages = await _local_storages()
+    if not storages:
+        return None
+
+    paths: Dict[str, Tuple[str, int]] = {}  # 分块哈希 -> (文件路径, 分块起始偏移)
+
+    async def resolve(chunk_hash: str, key: str, storage_id: int, offset: int):
+        if chunk_hash in paths:
+            return
+        async with drivers.registry.use(storages[storage_id]) as driver:
+            path = driver.local_path(key)
+        if path is not None:
+            paths[chunk_hash] = (path, offset)
+
+    pending = list(dict.fromkeys(chunk_hash for chunk_hash, _, _ in parts))
+    for i in range(0, len(pending), LOOKUP_BATCH):
+        batch = pending[i : i + LOOKUP_BATCH]
+        query = db.Chunk.filter(hash__in=batch, ec_data=0, codec=core.compression.NONE)
+        for chunk_hash, storage_id in await query.filter(
+            pack_id=None, storages__id__in=list(storages)
+        ).values_list("hash", "storages__id"):
+            await resolve(chunk_hash, chunk_hash, storage_id, 0)
+        # 打包的分块位于打包对象文件中的 pack_offset 处
+        for chunk_hash, pack_id, offset, storage_id in await query.filter(
+            pack__storages__id__in=list(storages)
+        ).values_list("hash", "pack_id", "pack_offset", "pack__storages__id"):
+            await resolve(chunk_hash, pack_id, storage_id, offset)
+        if any(chunk_hash not in paths for chunk_hash in batch):
+            return None
+    return [
+        (paths[chunk_hash][0], paths[chunk_hash][1] + lo, hi - lo)
+        for chunk_hash, lo, hi in parts
+    ]
+
+
+def _mmap_blocks(path: str, offset: int, count: int):
+    """
+    以 mmap 切片的形式产出文件内容，交给传输层时不经过 Python 层的读取和复制。
+
+    传输层可能暂存尚未发出的切片，因此不主动关闭映射，由最后一个切片释放时回收。
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, "MADV_SEQUENTIAL"):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mapped)
+    for pos in range(offset, offset + count, MMAP_BLOCK):
+        yield view[pos : min(pos + MMAP_BLOCK, offset + count)]
+
+
+class SegmentFileResponse(Response):
+    """
+    依次发送多个文件片段的响应。
+
+    ASGI 服务器支持 zerocopysend 扩展时由服务器调用 sendfile 发送；否则通过 mmap
+    把文件映射到内存，按 MMAP_BLOCK 切片交给传输层，不经过线程池读取，也不进入分块缓存。
+    分块文件不可变，删除（unlink）不影响已经打开或映射的文件。
+    """
+
+    def __init__(
+        self,
+        segments: List[Segment],
+        status_code: int = 200,
+        headers: Optional[dict] = None,
+        media_type: Optional[str] = None,
+    ):
+        self.segments = segments
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers.setdefault(
+            "content-length", str(sum(count for _, _, count in segments))
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if scope.get("method") == "HEAD" or not self.segments:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        zerocopy = ZEROCOPY in scope.get("extensions", {})
+        last = len(self.segments) - 1
+        for i, (path, offset, count) in enumerate(self.segments):
+            if zerocopy:
+                with open(path, "rb") as f:
+                    await send(
+                        {
+                            "type": ZEROCOPY,
+                            "file": f,
+                            "offset": offset,
+                            "count": count,
+                            "more_body": i < last,
+                        }
+                    )
+                continue
+            for block in _mmap_blocks(path, offset, count):
+                await send(
+                    {"type": "http.response.body", "body": block, "more_body": True}
+                )
+        if not zerocopy:
+            await send({"type": "http.response.body", "body": b""})
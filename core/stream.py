@@ -0,0 +1,39 @@
+import asyncio
+from collections import deque
+from typing import AsyncGenerator, Awaitable, Callable, Iterable, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+def _discard(tasks: Iterable[asyncio.Future]):
+    for task in tasks:
+        task.cancel()
+        # 取走异常，避免 "Task exception was never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def read_ahead(
+    keys: Iterable[K], fetch: Callable[[K], Awaitable[V]], window: int = 8
+) -> AsyncGenerator[V]:
+    """
+    按顺序产出 fetch(key) 的结果，同时预取后续最多 window - 1 个 key。
+
+    同一时刻最多有 window 个结果在获取中或等待消费，内存占用上限为 window 个分块。
+
+    :param keys: 按输出顺序排列的 key
+    :param fetch: 获取单个 key 的协程函数
+    :param window: 预取窗口大小
+    """
+    window = max(1, window)
+    pending: deque[asyncio.Future[V]] = deque()
+    try:
+        for key in keys:
+            pending.append(asyncio.ensure_future(fetch(key)))
+            if len(pending) >= window:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # 客户端断开或出错时取消尚未消费的预取
+        _discard(pending)
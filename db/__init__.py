@@ -1,23 +1,112 @@
 from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+from pypika_tortoise import Table
+import asyncio
 import os
 from .schema import *
+from . import conf
 import secrets
-from typing import Any
+from typing import Any, Callable, Dict, List, Optional
 import hashlib
 
+# 配置变更监听器，参数为变更的配置键
+_cfg_listeners: List[Callable[[str], None]] = []
+
+# 已知配置项的类型，读取时按此转换
+CFG_TYPES: Dict[str, type] = {
+    "chunk_size": int,
+    "chunking": str,
+    "cdc_min_size": int,
+    "cdc_avg_size": int,
+    "cdc_max_size": int,
+    "num_storages": int,
+    "write_quorum": int,
+    "upload_concurrency": int,
+    "dedup_batch": int,
+    "download_window": int,
+    "secret_key": str,
+    "compression": str,
+    "compression_level": int,
+    "compression_min_ratio": float,
+    "redundancy": str,
+    "ec_data_shards": int,
+    "ec_parity_shards": int,
+    "gc_interval": float,
+    "gc_grace_period": float,
+    "gc_batch": int,
+    "gc_concurrency": int,
+    "gc_rate": float,
+    "health_interval": float,
+    "health_timeout": float,
+    "pack_threshold": int,
+    "pack_size": int,
+    "pack_delay": float,
+    "pack_compact_ratio": float,
+}
+
+# 配置版本号所在的键，每次 set_cfg 都写入新值，其他进程据此判断是否需要重新加载
+VERSION_KEY = "_version"
+
+# 内存中的配置，None 表示尚未加载
+_cfg: Optional[Dict[str, Any]] = None
+_cfg_version: Optional[str] = None
+_cfg_watcher: Optional[asyncio.Task] = None
+
+# 旧数据库中缺少的列：(表名, 列名, 列定义)，generate_schemas 只会创建缺失的表
+_COLUMNS = [
+    ("chunk", "refcount", "INT NOT NULL DEFAULT 0"),
+    ("chunk", "ec_data", "SMALLINT NOT NULL DEFAULT 0"),
+    ("chunk", "ec_parity", "SMALLINT NOT NULL DEFAULT 0"),
+    ("chunk", "codec", "VARCHAR(16) NOT NULL DEFAULT 'none'"),
+    ("chunk", "stored_size", "INT NULL"),
+    ("chunk", "pack_id", "VARCHAR(40) NULL"),
+    ("chunk", "pack_offset", "BIGINT NULL"),
+]
+
 
 async def init_db():
     await Tortoise.init(
         db_url=os.environ.get("DB_URL", "sqlite://KianaFS.db"),
         modules={"models": ["db.schema"]},  # 替换为你的模块名
     )
+    # 必须先于 generate_schemas 补齐列，否则新列上的索引会建在不存在的列上
+    await _add_columns()
     await Tortoise.generate_schemas()
 
+    if not await Directory.filter(parent_id=None).exists():
+        await Directory.create(parent_id=None, name="")  # 根目录
+
     if await Config.get_or_none(key="init") is None:
         await Config.create(key="init", value=True)
+        await Config.create(key="refcount_ready", value=True)
+        await Config.create(key="namespace_ready", value=True)
+        await Config.create(key="manifest_ready", value=True)
         await Config.create(key="chunk_size", value=1024 * 1024)
+        await Config.create(key="chunking", value="fixed")
         await Config.create(key="num_storages", value=3)
+        await Config.create(key="write_quorum", value=2)
+        await Config.create(key="compression", value="none")
+        await Config.create(key="compression_level", value=3)
+        await Config.create(key="compression_min_ratio", value=0.9)
+        await Config.create(key="redundancy", value="replication")
+        await Config.create(key="ec_data_shards", value=4)
+        await Config.create(key="ec_parity_shards", value=2)
+        await Config.create(key="upload_concurrency", value=4)
+        await Config.create(key="dedup_batch", value=64)
+        await Config.create(key="download_window", value=8)
         await Config.create(key="secret_key", value=str(secrets.token_hex(16)))
+        await Config.create(key="gc_interval", value=60)
+        await Config.create(key="gc_grace_period", value=3600)
+        await Config.create(key="gc_batch", value=256)
+        await Config.create(key="gc_concurrency", value=8)
+        await Config.create(key="gc_rate", value=100)
+        await Config.create(key="health_interval", value=30)
+        await Config.create(key="health_timeout", value=5)
+        await Config.create(key="pack_threshold", value=0)
+        await Config.create(key="pack_size", value=32 * 1024 * 1024)
+        await Config.create(key="pack_delay", value=0.05)
+        await Config.create(key="pack_compact_ratio", value=0.5)
 
         admin_pwd = secrets.token_hex(8)
         print(f"admin password: {admin_pwd}")
@@ -27,16 +116,280 @@ async def init_db():
             permission="rwa",
         )
 
+    # 必须先于引用计数回填，回填依赖迁移后的文件与分块关联
+    if await Config.get_or_none(key="namespace_ready") is None:
+        await _migrate_namespace()
+        await Config.create(key="namespace_ready", value=True)
+
+    # 依赖迁移到新文件表的分块关联
+    if await Config.get_or_none(key="manifest_ready") is None:
+        await _backfill_manifests()
+        await Config.create(key="manifest_ready", value=True)
+
+    if await Config.get_or_none(key="refcount_ready") is None:
+        await _backfill_refcount()
+        await Config.create(key="refcount_ready", value=True)
+
+    await load_cfg()
+
+
+async def _add_columns():
+    conn = Tortoise.get_connection("default")
+    for table, column, definition in _COLUMNS:
+        try:
+            await conn.execute_query(f"SELECT 1 FROM {table} LIMIT 1")
+        except OperationalError:
+            continue  # 表尚不存在，由 generate_schemas 创建
+        try:
+            await conn.execute_query(f"SELECT {column} FROM {table} LIMIT 1")
+        except OperationalError:
+            await conn.execute_script(
+                f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+            )
+
+
+async def _backfill_refcount():
+    """根据文件与分块的关联重新计算分块引用计数，用于升级旧数据库"""
+    m2m = File._meta.fields_map["chunks"]
+    chunk = Chunk._meta.db_table
+    await Tortoise.get_connection("default").execute_script(
+        f"UPDATE {chunk} SET refcount = (SELECT COUNT(*) FROM {m2m.through} "
+        f"WHERE {m2m.through}.{m2m.forward_key} = {chunk}.hash)"
+    )
+
+
+LEGACY_FILE = "file"  # 旧版以完整路径为唯一键的文件表
+LEGACY_FILE_CHUNK = "file_chunk"
+MIGRATE_BATCH = 1000
+
+
+async def _migrate_namespace():
+    """
+    把旧版 file 表中的文件迁移到目录树，用于升级旧数据库。
+
+    按文件名中的 "/" 逐级建立目录，保留文件哈希、大小和更新时间，复制文件与分块的关联，
+    最后一次性计算各目录的汇总数据。规范化后重名的文件（如 "a//b" 与 "a/b"）在名称后追加哈希前缀。
+    旧表保留不动，确认迁移无误后可以手动删除。
+    """
+    conn = Tortoise.get_connection("default")
+    try:
+        await conn.execute_query(f"SELECT filename FROM {LEGACY_FILE} LIMIT 1")
+    except OperationalError:
+        return
+
+    legacy = Table(LEGACY_FILE)
+    entry = Table(File._meta.db_table)
+    columns = ("hash", "directory_id", "name", "size", "update_time")
+    root = await Directory.filter(parent_id=None).order_by("id").first()
+    dirs: Dict[tuple, int] = {}  # (上级目录 ID, 名称) -> 目录 ID
+    parents: Dict[int, int] = {}
+    totals: Dict[int, List[float]] = {}  # 目录 ID -> [文件数, 总大小]
+
+    async with in_transaction() as tx:
+
+        async def directory_of(parts: List[str]) -> int:
+            dir_id = root.id  # type: ignore
+            for name in parts:
+                key = (dir_id, name)
+                if key not in dirs:
+                    created = await Directory.create(
+                        parent_id=dir_id, name=name, using_db=tx
+                    )
+                    dirs[key] = created.id
+                    parents[created.id] = dir_id
+                dir_id = dirs[key]
+            return dir_id
+
+        def add_total(dir_id: int, size: float):
+            total = totals.setdefault(dir_id, [0, 0.0])
+            total[0] += 1
+            total[1] += size
+
+        # 旧文件名是唯一的，规范化后路径不变的文件不会互相重名，可以批量插入；
+        # 其余文件（通常很少）最后逐个插入，与已有文件重名时改名
+        deferred = []
+        last = ""
+        while True:
+            query = (
+                conn.query_class.from_(legacy)
+                .select("hash", "filename", "size", "update_time")
+                .where(legacy.hash > last)
+                .orderby(legacy.hash)
+                .limit(MIGRATE_BATCH)
+            )
+            _, rows = await tx.execute_query(*query.get_parameterized_sql())
+            if not rows:
+                break
+            last = rows[-1]["hash"]
+
+            insert = conn.query_class.into(entry).columns(*columns)
+            inserted = False
+            for row in rows:
+                parts = [part for part in row["filename"].split("/") if part]
+                if "/".join(parts) != row["filename"]:
+                    deferred.append(row)
+                    continue
+                dir_id = await directory_of(parts[:-1])
+                insert = insert.insert(
+                    row["hash"], dir_id, parts[-1], row["size"], row["update_time"]
+                )
+                inserted = True
+                add_total(dir_id, row["size"])
+            if inserted:
+                await tx.execute_query(*insert.get_parameterized_sql())
+
+        for row in deferred:
+            parts = [part for part in row["filename"].split("/") if part]
+            parts = parts or [row["hash"]]
+            dir_id = await directory_of(parts[:-1])
+            name = parts[-1]
+            if await File.exists(directory_id=dir_id, name=name, using_db=tx):
+                name = f"{name}~{row['hash'][:8]}"
+            insert = conn.query_class.into(entry).columns(*columns)
+            insert = insert.insert(
+                row["hash"], dir_id, name, row["size"], row["update_time"]
+            )
+            await tx.execute_query(*insert.get_parameterized_sql())
+            add_total(dir_id, row["size"])
+
+        m2m = File._meta.fields_map["chunks"]
+        links = Table(LEGACY_FILE_CHUNK)
+        copy = (
+            conn.query_class.into(Table(m2m.through))
+            .columns(m2m.backward_key, m2m.forward_key)
+            .from_(links)
+            .select(links.file_id, links.chunk_id)
+            .orderby(links.rowid)  # 保持写入顺序，分块清单的回填依赖该顺序
+        )
+        try:
+            await tx.execute_query(*copy.get_parameterized_sql())
+        except OperationalError:
+            pass  # 没有旧的关联表
+
+        # 汇总：每个目录的文件数、大小计入自身及所有上级目录，每个目录计入所有上级目录的子目录数
+        aggregates: Dict[int, List[float]] = {}  # 目录 ID -> [文件数, 子目录数, 总大小]
+        for dir_id, (count, size) in totals.items():
+            current: Optional[int] = dir_id
+            while current is not None:
+                aggregate = aggregates.setdefault(current, [0, 0, 0.0])
+                aggregate[0] += count
+                aggregate[2] += size
+                current = parents.get(current)
+        for dir_id in parents:
+            current = parents.get(dir_id)
+            while current is not None:
+                aggregates.setdefault(current, [0, 0, 0.0])[1] += 1
+                current = parents.get(current)
+        for dir_id, (count, subdirs, size) in aggregates.items():
+            await Directory.filter(id=dir_id).using_db(tx).update(
+                file_count=int(count), dir_count=int(subdirs), size=size
+            )
+
+
+async def _backfill_manifests():
+    """
+    为没有分块清单的旧文件生成清单，用于升级旧数据库。
+
+    旧文件只在多对多关联中记录分块，其中没有分块顺序，也无法表示重复的分块；
+    这里按关联表的 rowid（即写入顺序）生成清单，每个分块只出现一次。
+    分块大小之和与文件大小不一致的文件（如包含重复分块）无法还原，跳过并打印警告。
+    """
+    from core.manifest import Manifest
+
+    conn = Tortoise.get_connection("default")
+    m2m = File._meta.fields_map["chunks"]
+    entry = Table(File._meta.db_table)
+    manifest = Table(FileManifest._meta.db_table)
+    through = Table(m2m.through)
+    chunk = Table(Chunk._meta.db_table)
+
+    last = ""
+    while True:
+        query = (
+            conn.query_class.from_(entry)
+            .left_join(manifest)
+            .on(manifest.hash == entry.hash)
+            .select(entry.hash, entry.size)
+            .where(manifest.hash.isnull() & (entry.hash > last))
+            .orderby(entry.hash)
+            .limit(MIGRATE_BATCH)
+        )
+        _, rows = await conn.execute_query(*query.get_parameterized_sql())
+        if not rows:
+            return
+        file_sizes = {row["hash"]: row["size"] for row in rows}
+        hashes = list(file_sizes)
+        last = hashes[-1]
+
+        query = (
+            conn.query_class.from_(through)
+            .join(chunk)
+            .on(chunk.hash == through[m2m.forward_key])
+            .select(through[m2m.backward_key], chunk.hash, chunk.size)
+            .where(through[m2m.backward_key].isin(hashes))
+            .orderby(through.rowid)
+        )
+        _, links = await conn.execute_query(*query.get_parameterized_sql())
+        layouts: Dict[str, List[tuple]] = {file_hash: [] for file_hash in hashes}
+        for link in links:
+            layouts[link[m2m.backward_key]].append((link["hash"], link["size"]))
+
+        manifests = []
+        for file_hash, layout in layouts.items():
+            sizes = [int(round(size * 1024)) for _, size in layout]
+            if sum(sizes) != int(round(file_sizes[file_hash] * 1024)):
+                print(
+                    f"Skipped manifest for file {file_hash}: "
+                    f"chunk sizes add up to {sum(sizes)} bytes, "
+                    f"file size is {file_sizes[file_hash]} KB"
+                )
+                continue
+            chunks, offsets = Manifest.build([h for h, _ in layout], sizes).pack()
+            manifests.append(
+                FileManifest(hash=file_hash, chunks=chunks, offsets=offsets)
+            )
+        await FileManifest.bulk_create(manifests)
+
+
+def _coerce(key: str, value):
+    kind = CFG_TYPES.get(key)
+    if kind is None or value is None or isinstance(value, kind):
+        return value
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _notify(key: str):
+    for listener in _cfg_listeners:
+        listener(key)
+
+
+async def load_cfg():
+    """
+    从数据库加载全部配置到内存，并对发生变化的键触发监听器
+    """
+    global _cfg, _cfg_version
+    rows = await Config.all().values_list("key", "value")
+    cfg = {key: _coerce(key, value) for key, value in rows}
+    version = cfg.pop(VERSION_KEY, None)
+
+    old, _cfg, _cfg_version = _cfg, cfg, version
+    if old is not None:
+        for key in old.keys() | cfg.keys():
+            if old.get(key) != cfg.get(key):
+                _notify(key)
+
 
 async def get_cfg(key: str, default: Any = None):
-    val = await Config.get_or_none(key=key)
-    if val is None:
-        return default
-    else:
-        return val.value
+    if _cfg is None:  # 未加载时（如命令行工具）直接查询
+        val = await Config.get_or_none(key=key)
+        return default if val is None else _coerce(key, val.value)
+    return _cfg.get(key, default)
 
 
-async def set_cfg(key: str, value):
+async def _write_cfg(key: str, value):
     val = await Config.get_or_none(key=key)
     if val is None:
         await Config.create(key=key, value=value)
@@ -45,9 +398,93 @@ async def set_cfg(key: str, value):
         await val.save()
 
 
+async def set_cfg(key: str, value):
+    global _cfg_version
+    await _write_cfg(key, value)
+    # 版本号使用随机值而不是计数器，并发写入时也不会出现相同的版本号
+    version = secrets.token_hex(8)
+    await _write_cfg(VERSION_KEY, version)
+    if _cfg is not None:
+        _cfg[key] = _coerce(key, value)
+        _cfg_version = version
+    _notify(key)
+
+
+async def _watch_cfg(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            val = await Config.get_or_none(key=VERSION_KEY)
+            if (val and val.value) != _cfg_version:
+                await load_cfg()
+        except Exception as e:
+            print(f"Failed to reload config: {e}")
+
+
+def start_cfg_watcher(interval: float = conf.CONFIG_POLL_INTERVAL):
+    """
+    启动配置轮询任务，其他进程修改配置后在 interval 秒内生效
+    """
+    global _cfg_watcher
+    if _cfg_watcher is None and interval > 0:
+        _cfg_watcher = asyncio.create_task(_watch_cfg(interval))
+
+
+async def stop_cfg_watcher():
+    global _cfg_watcher
+    if _cfg_watcher is None:
+        return
+    _cfg_watcher.cancel()
+    try:
+        await _cfg_watcher
+    except asyncio.CancelledError:
+        pass
+    _cfg_watcher = None
+
+
+def on_cfg_change(listener: Callable[[str], None]):
+    """注册配置变更监听器"""
+    _cfg_listeners.append(listener)
+    return listener
+
+
 async def exists(table, key: str):
     val = await table.get_or_none(key=key)
     if val is None:
         return False
     else:
         return True
+
+
+async def bulk_add_m2m(model, field: str, pairs, using_db=None, batch_size: int = 400):
+    """
+    批量写入多对多关联，已存在的关联会被跳过。
+
+    :param model: 定义多对多字段的模型
+    :param field: 多对多字段名
+    :param pairs: (model 主键, 关联模型主键) 列表
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    m2m = model._meta.fields_map[field]
+    conn = using_db or model._meta.db
+    through = Table(m2m.through)
+    backward, forward = through[m2m.backward_key], through[m2m.forward_key]
+
+    owners = list({b for b, _ in pairs})
+    for i in range(0, len(owners), batch_size):
+        query = (
+            conn.query_class.from_(through)
+            .where(backward.isin(owners[i : i + batch_size]))
+            .select(m2m.backward_key, m2m.forward_key)
+        )
+        _, rows = await conn.execute_query(*query.get_parameterized_sql())
+        pairs -= {(row[m2m.backward_key], row[m2m.forward_key]) for row in rows}
+
+    pairs = list(pairs)
+    for i in range(0, len(pairs), batch_size):
+        query = conn.query_class.into(through).columns(backward, forward)
+        for b, f in pairs[i : i + batch_size]:
+            query = query.insert(b, f)
+        await conn.execute_query(*query.get_parameterized_sql())
@@ -4,7 +4,9 @@ import os
 from typing import Optional
 
 dotenv.load_dotenv()
-json_config = json.loads(open("conf.json", "r").read())
+json_config = {}
+if os.path.exists("conf.json"):
+    json_config = json.loads(open("conf.json", "r").read())
 
 
 def _get_key(key: str, default: Optional[str] = None):
@@ -20,3 +22,15 @@ REDIS_DB = int(_get_key("REDIS_DB", "0"))
 REDIS_PASSWORD = _get_key("REDIS_PASSWORD", "")
 EXPIRE_TIME = int(_get_key("EXPIRE_TIME", "86400"))
 MAX_PATH = int(_get_key("MAX_PATH", "8192"))
+CHUNK_CACHE_SIZE = int(_get_key("CHUNK_CACHE_SIZE", str(256 * 1024 * 1024)))
+DISK_CACHE_DIR = _get_key("DISK_CACHE_DIR", "")
+DISK_CACHE_SIZE = int(_get_key("DISK_CACHE_SIZE", str(10 * 1024 * 1024 * 1024)))
+AUTH_CACHE_TTL = float(_get_key("AUTH_CACHE_TTL", "30"))
+CONFIG_POLL_INTERVAL = float(_get_key("CONFIG_POLL_INTERVAL", "2"))
+CPU_THREADS = int(_get_key("CPU_THREADS", str(os.cpu_count() or 4)))
+CPU_PROCESSES = int(_get_key("CPU_PROCESSES", "0"))
+READ_HEDGE_QUANTILE = float(_get_key("READ_HEDGE_QUANTILE", "0.95"))
+READ_HEDGE_MIN_DELAY = float(_get_key("READ_HEDGE_MIN_DELAY", "0.01"))
+CIRCUIT_FAILURES = int(_get_key("CIRCUIT_FAILURES", "5"))
+CIRCUIT_COOLDOWN = float(_get_key("CIRCUIT_COOLDOWN", "30"))
+SENDFILE = _get_key("SENDFILE", "true").lower() == "true"
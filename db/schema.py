@@ -50,24 +50,94 @@ class Storage(Model):
         return f"{self.name} ({self.driver})"
 
 
+class Directory(Model):
+    id = fields.IntField(pk=True, auto_increment=True, generated=True)  # 目录 ID
+    parent = fields.ForeignKeyField(
+        "models.Directory",
+        related_name="children",
+        null=True,
+        on_delete=fields.RESTRICT,
+    )  # 上级目录，根目录为空
+    name = fields.CharField(max_length=1024)  # 目录名，根目录为空字符串
+    file_count = fields.BigIntField(default=0)  # 子树中的文件数
+    dir_count = fields.BigIntField(default=0)  # 子树中的目录数（不含自身）
+    size = fields.FloatField(default=0)  # 子树中文件的总大小 (KB)
+    update_time = fields.DatetimeField(auto_now=True)  # 更新时间
+
+    class Meta:  # type: ignore
+        db_table = "directory"
+        unique_together = (("parent", "name"),)
+
+    def __str__(self):
+        return f"{self.name}/ ({self.file_count} files)"
+
+
 class File(Model):
     hash = fields.CharField(max_length=40, unique=True, pk=True)  # 文件哈希值 (SHA1)
-    filename = fields.CharField(max_length=8192, unique=True)  # 文件名
-    chunks = fields.ManyToManyField("models.Chunk")  # 多对多关系，关联到Chunk模型
+    directory = fields.ForeignKeyField(
+        "models.Directory", related_name="files", on_delete=fields.RESTRICT
+    )  # 所在目录
+    name = fields.CharField(max_length=1024)  # 文件名（不含目录）
+    # 旧版的文件与分块关联，只用于升级迁移；分块以 FileManifest 为准
+    chunks = fields.ManyToManyField("models.Chunk")
     size = fields.FloatField()  # 文件大小 (KB)
     update_time = fields.DatetimeField(auto_now=True)  # 更新时间
 
     class Meta:  # type: ignore
-        db_table = "file"
+        # 旧版的 file 表以完整路径为唯一键，无法原地改为按目录索引，迁移后不再使用。
+        # Tortoise 按 table（而不是 db_table）确定表名
+        table = "file_entry"
+        unique_together = (("directory", "name"),)
+
+    def __str__(self):
+        return f"{self.name} ({self.size} KB)"
+
+
+class FileManifest(Model):
+    hash = fields.CharField(max_length=40, pk=True)  # 文件哈希值，对应 File.hash
+    chunks = fields.BinaryField()  # 按顺序拼接的分块摘要，每个 16 字节
+    offsets = fields.BinaryField()  # 每个分块的结束偏移量，uint64 小端序
+
+    class Meta:  # type: ignore
+        db_table = "file_manifest"
+
+    def __str__(self):
+        return f"{self.hash} ({len(self.offsets) // 8} chunks)"
+
+
+class Pack(Model):
+    id = fields.CharField(max_length=40, pk=True)  # 存储节点上的对象名
+    size = fields.BigIntField()  # 对象大小（字节）
+    live = fields.BigIntField(default=0)  # 仍被分块引用的字节数
+    storages = fields.ManyToManyField(
+        "models.Storage", related_name="packs"
+    )  # 保存该对象的存储节点
+    update_time = fields.DatetimeField(auto_now=True)  # 更新时间
+
+    class Meta:  # type: ignore
+        table = "pack"
 
     def __str__(self):
-        return f"{self.filename} ({self.size} KB)"
+        return self.id
 
 
 class Chunk(Model):
     hash = fields.CharField(max_length=40, unique=True, pk=True)  # 文件块哈希值 (SHA1)
     size = fields.FloatField()  # 文件块大小 (KB)
     storages = fields.ManyToManyField("models.Storage")  # 多对多关系，关联到Storage模型
+    refcount = fields.IntField(default=0, index=True)  # 引用该分块的文件数
+    ec_data = fields.SmallIntField(default=0)  # 纠删码数据分片数，0 表示多副本存储
+    ec_parity = fields.SmallIntField(default=0)  # 纠删码校验分片数
+    codec = fields.CharField(max_length=16, default="none")  # 压缩编码
+    stored_size = fields.IntField(null=True)  # 实际存储的字节数，为空表示与 size 相同
+    pack = fields.ForeignKeyField(
+        "models.Pack",
+        related_name="chunks",
+        null=True,
+        index=True,
+        on_delete=fields.RESTRICT,
+    )  # 所在的打包对象，为空表示单独存储
+    pack_offset = fields.BigIntField(null=True)  # 在打包对象中的起始偏移量
     update_time = fields.DatetimeField(auto_now=True)  # 更新时间
 
     class Meta:  # type: ignore
@@ -77,6 +147,24 @@ class Chunk(Model):
         return f"{self.hash} ({self.size} KB)"
 
 
+class Shard(Model):
+    id = fields.IntField(pk=True, auto_increment=True, generated=True)
+    chunk = fields.ForeignKeyField(
+        "models.Chunk", related_name="shards", on_delete=fields.CASCADE
+    )  # 所属分块
+    index = fields.SmallIntField()  # 分片序号，小于 ec_data 的为数据分片
+    storage = fields.ForeignKeyField(
+        "models.Storage", related_name="shards", on_delete=fields.CASCADE
+    )  # 保存该分片的存储节点
+
+    class Meta:  # type: ignore
+        db_table = "shard"
+        unique_together = (("chunk", "index"),)
+
+    def __str__(self):
+        return f"{self.chunk_id}.{self.index}"  # type: ignore
+
+
 class User(Model):
     id = fields.IntField(pk=True, auto_increment=True, generated=True, index=True)
     username = fields.CharField(max_length=255, unique=True)
@@ -1,14 +1,54 @@
 import os
 import importlib
-from typing import Any, Dict, List, Tuple, Optional, Generator
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Tuple,
+    Optional,
+    Generator,
+    Union,
+)
+from contextlib import asynccontextmanager
 import asyncio
+import time
+import orjson
 import anyio.to_thread
 
+BLOCK_SIZE = 1024 * 1024  # 流式读写的默认块大小
+
+Blocks = Union[AsyncIterable[bytes], Iterable[bytes]]
+
+
+def split_blocks(data: bytes, block_size: int = BLOCK_SIZE) -> Iterable[memoryview]:
+    """把内存中的分块切成不复制数据的 memoryview 块"""
+    view = memoryview(data)
+    return (view[i : i + block_size] for i in range(0, len(view), block_size))
+
+
+async def iter_blocks(blocks: Blocks) -> AsyncIterator[bytes]:
+    """统一同步和异步的块序列"""
+    if hasattr(blocks, "__aiter__"):
+        async for block in blocks:  # type: ignore
+            yield block
+    else:
+        for block in blocks:  # type: ignore
+            yield block
+
 
 class Driver:
     name: str
     name_human: str
     setting_define: List[Dict[str, Any]] = []
+    concurrent_safe: bool = True  # 单个实例能否被多个协程同时使用
+    pool_size: int = 4  # 非并发安全驱动每个存储节点的最大连接数
+    max_idle: float = 300  # 空闲超过该秒数的连接在复用前重新建立
+    remote: bool = True  # 远程存储的读取结果会写入本地磁盘缓存
+    # 是否原生实现了流式读写，否则流式接口会在内存中拼接整个分块
+    streaming: bool = False
 
     def __init__(self, settings: Dict[str, Any]):
         self.setting = settings
@@ -34,9 +74,61 @@ class Driver:
             "delete_chunk method must be implemented in the driver class"
         )
 
+    async def get_chunk_range(self, hash: str, offset: int, length: int) -> bytes:
+        """
+        读取分块中从 offset 开始的 length 个字节，用于从打包对象中取出小分块。
+
+        默认实现读取整个分块后切片，支持范围读取的驱动应覆盖此方法。
+        """
+        data = await self.get_chunk(hash)
+        return data[offset : offset + length]  # type: ignore
+
+    def local_path(self, hash: str) -> Optional[str]:
+        """
+        分块在本机文件系统上的路径，用于 sendfile 直接发送文件。
+
+        只有按原样保存在本地文件中的驱动需要实现，分块不存在时返回 None。
+        """
+        return None
+
+    async def open_chunk_reader(
+        self, hash: str, block_size: int = BLOCK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """
+        以块为单位读取分块，每块不超过 block_size 字节。
+
+        返回的异步迭代器占用驱动实例，应在 registry.use() 的上下文中读完或关闭。
+        默认实现读取整个分块后切分。
+        """
+        data = await self.get_chunk(hash)
+        for block in split_blocks(data, block_size):  # type: ignore
+            yield block
+
+    async def write_chunk_from(
+        self, blocks: Blocks, hash: str, length: Optional[int] = None
+    ):
+        """
+        从块序列写入分块，写入失败时不应留下不完整的分块。
+
+        默认实现在内存中拼接所有块后调用 add_chunk。
+
+        :param blocks: bytes 或 memoryview 的同步或异步可迭代对象
+        :param length: 分块总大小，未知时为 None
+        """
+        data = b"".join([block async for block in iter_blocks(blocks)])
+        await self.add_chunk(data, hash)
+
     async def close(self):
         pass
 
+    async def ping(self):
+        """
+        轻量探测存储节点是否可用，不可用时抛出异常。
+
+        默认不做额外检查，能够借出已连接的实例即视为可用。
+        """
+        pass
+
     def __repr__(self) -> str:
         """
         返回存储模块的字符串表示。
@@ -87,7 +179,167 @@ async def get_storage(name: str, setting: dict) -> Driver:
     return driver
 
 
+async def _close_driver(driver: Driver):
+    try:
+        await driver.close()
+    except Exception:
+        pass
+
+
+class DriverPool:
+    """
+    单个存储节点的驱动连接池。
+
+    并发安全的驱动共享一个已连接的实例；非并发安全的驱动（如 FTP）最多建立
+    pool_size 个实例，每个实例同一时间只借给一个调用者。
+    使用中抛出异常或空闲过久的实例会被丢弃，下次借出时重新连接。
+    """
+
+    def __init__(self, name: str, setting: dict):
+        self.name = name
+        self.setting = setting
+        self.driver_class = drivers[name]
+        self.shared = self.driver_class.concurrent_safe
+        self.size = int(setting.get("pool_size") or self.driver_class.pool_size)
+        self._idle: List[Tuple[Driver, float]] = []  # (实例, 最后使用时间)
+        self._instance: Optional[Driver] = None
+        self._last_used = 0.0
+        self._lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(self.size)
+        self._closing: set[asyncio.Task] = set()
+        self._closed = False
+
+    def _expired(self, last_used: float) -> bool:
+        return time.monotonic() - last_used > self.driver_class.max_idle
+
+    def _discard(self, driver: Driver):
+        # 在后台关闭，避免在取消或异常路径上等待网络 I/O
+        task = asyncio.create_task(_close_driver(driver))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _acquire_shared(self) -> Driver:
+        async with self._lock:
+            if self._instance is not None and self._expired(self._last_used):
+                self._discard(self._instance)
+                self._instance = None
+            if self._instance is None:
+                self._instance = await get_storage(self.name, self.setting)
+            self._last_used = time.monotonic()
+            return self._instance
+
+    async def _acquire_exclusive(self) -> Driver:
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                driver, last_used = self._idle.pop()
+                if not self._expired(last_used):
+                    break
+                self._discard(driver)
+            else:
+                driver = await get_storage(self.name, self.setting)
+        except BaseException:
+            self._slots.release()
+            raise
+        return driver
+
+    async def acquire(self) -> Driver:
+        if self._closed:
+            raise RuntimeError(f"Driver pool for {self.name} is closed")
+        if self.shared:
+            return await self._acquire_shared()
+        return await self._acquire_exclusive()
+
+    def release(self, driver: Driver, broken: bool = False):
+        if self.shared:
+            if broken and self._instance is driver:
+                self._instance = None
+                self._discard(driver)
+            return
+
+        if broken or self._closed:
+            self._discard(driver)
+        else:
+            self._idle.append((driver, time.monotonic()))
+        self._slots.release()
+
+    @asynccontextmanager
+    async def driver(self):
+        driver = await self.acquire()
+        try:
+            yield driver
+        except FileNotFoundError:
+            # 分块不存在不代表连接损坏
+            self.release(driver)
+            raise
+        except BaseException:
+            self.release(driver, broken=True)
+            raise
+        self.release(driver)
+
+    async def close(self):
+        self._closed = True
+        if self._instance is not None:
+            self._discard(self._instance)
+            self._instance = None
+        for driver, _ in self._idle:
+            self._discard(driver)
+        self._idle.clear()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+
+class DriverRegistry:
+    """
+    进程级驱动注册表，按 Storage.id 缓存已连接的驱动连接池。
+
+    存储节点的驱动类型或设置发生变化时，旧连接池会被关闭并重建。
+    """
+
+    def __init__(self):
+        self._pools: Dict[int, Tuple[bytes, DriverPool]] = {}
+        self._closing: set[asyncio.Task] = set()
+
+    def pool(self, storage) -> DriverPool:
+        fingerprint = orjson.dumps(
+            [storage.driver, storage.driver_settings], option=orjson.OPT_SORT_KEYS
+        )
+        entry = self._pools.get(storage.id)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+
+        if entry is not None:
+            task = asyncio.create_task(entry[1].close())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+        pool = DriverPool(storage.driver, storage.driver_settings)
+        self._pools[storage.id] = (fingerprint, pool)
+        return pool
+
+    def use(self, storage):
+        """
+        借出存储节点的驱动实例。
+
+        :param storage: db.Storage 实例
+        :return: 异步上下文管理器，产出已连接的 Driver
+        """
+        return self.pool(storage).driver()
+
+    async def discard(self, storage_id: int):
+        entry = self._pools.pop(storage_id, None)
+        if entry is not None:
+            await entry[1].close()
+
+    async def close(self):
+        pools = [pool for _, pool in self._pools.values()]
+        self._pools.clear()
+        await asyncio.gather(
+            *(pool.close() for pool in pools), *self._closing, return_exceptions=True
+        )
+
+
 drivers = {storager.name: storager for storager in load_driver()}
+registry = DriverRegistry()
 
 # 导出公共接口
-__all__ = ["drivers"]
+__all__ = ["drivers", "registry", "BLOCK_SIZE", "split_blocks", "iter_blocks"]
@@ -1,6 +1,7 @@
 from drivers import Driver, async_run
 import os
 from alist import AList, AListUser, AListFile
+import aiohttp
 import asyncio
 
 
@@ -43,6 +44,9 @@ class AListDriver(Driver):
     async def connect(self):
         await self.alist.login(self.user)
 
+    async def ping(self):
+        await self.alist.user_info()
+
     async def add_chunk(self, data, hash):
         return await self.alist.upload(os.path.join(self.setting["root"], hash), data)
 
@@ -53,5 +57,19 @@ class AListDriver(Driver):
 
         raise FileNotFoundError()
 
+    async def get_chunk_range(self, hash, offset, length):
+        file = await self.alist.open(os.path.join(self.setting["root"], hash))
+        if not isinstance(file, AListFile):
+            raise FileNotFoundError()
+        # 带 Range 请求直链，只下载需要的字节
+        headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+        async with aiohttp.ClientSession() as session:
+            async with session.get(file.url, headers=headers) as response:
+                response.raise_for_status()
+                data = await response.read()
+        if response.status != 206:  # 服务端忽略了 Range，返回的是整个对象
+            data = data[offset : offset + length]
+        return data
+
     async def delete_chunk(self, hash):
         return await self.alist.remove(os.path.join(self.setting["root"], hash))
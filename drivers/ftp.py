@@ -1,4 +1,4 @@
-from drivers import Driver
+from drivers import BLOCK_SIZE, Driver, iter_blocks
 import os
 import aioftp
 
@@ -6,6 +6,8 @@ import aioftp
 class FTPDriver(Driver):
     name = "ftp"
     name_human = "FTP存储"
+    concurrent_safe = False  # aioftp 客户端只有一条控制连接
+    streaming = True
 
     setting_define = [
         {
@@ -58,6 +60,10 @@ class FTPDriver(Driver):
         if self.client:
             await self.client.quit()
 
+    async def ping(self):
+        # PWD 比 NOOP 支持得更普遍（aioftp 自带的服务端就没有实现 NOOP）
+        await self.client.get_current_directory()
+
     async def add_chunk(self, data, hash):
         async with self.client.upload_stream(hash) as stream:  # type: ignore
             await stream.write(data)
@@ -68,6 +74,42 @@ class FTPDriver(Driver):
             data = await stream.read()
             return data
 
+    async def get_chunk_range(self, hash, offset, length):
+        # REST 跳到 offset，读够 length 个字节后关闭数据连接，不下载对象的其余部分
+        stream = await self.client.download_stream(hash, offset=offset)  # type: ignore
+        data = bytearray()
+        try:
+            while len(data) < length:
+                block = await stream.read(length - len(data))
+                if not block:
+                    break
+                data += block
+        except BaseException:
+            stream.close()
+            raise
+        # 读到对象末尾时服务端回复 226，提前关闭时回复 426 或 451
+        await stream.finish(("2xx", "4xx"))
+        return bytes(data)
+
+    async def open_chunk_reader(self, hash, block_size=BLOCK_SIZE):
+        async with self.client.download_stream(hash) as stream:  # type: ignore
+            async for block in stream.iter_by_block(block_size):
+                yield block
+
+    async def write_chunk_from(self, blocks, hash, length=None):
+        try:
+            async with self.client.upload_stream(hash) as stream:  # type: ignore
+                async for block in iter_blocks(blocks):
+                    await stream.write(block)
+        except Exception:
+            # 尽量删除写了一半的文件，连接已损坏时交给连接池丢弃
+            try:
+                await self.client.remove(hash)
+            except Exception:
+                pass
+            raise
+        return True
+
     async def delete_chunk(self, hash):
         await self.client.remove(hash)
         return True
@@ -1,11 +1,15 @@
-from drivers import Driver
+from drivers import BLOCK_SIZE, Driver, iter_blocks
 import os
+import secrets
 import aiofiles
+import aiofiles.os
 
 
 class LocalDriver(Driver):
     name = "local"
     name_human = "本地存储"
+    remote = False
+    streaming = True
 
     setting_define = [
         {
@@ -35,6 +39,41 @@ class LocalDriver(Driver):
         ) as f:
             return await f.read()
 
+    async def get_chunk_range(self, hash, offset, length):
+        async with aiofiles.open(os.path.join(self.path, hash), "rb") as f:
+            await f.seek(offset)
+            return await f.read(length)
+
+    def local_path(self, hash):
+        path = os.path.join(self.path, hash)
+        return path if os.path.isfile(path) else None
+
+    async def open_chunk_reader(self, hash, block_size=BLOCK_SIZE):
+        async with aiofiles.open(os.path.join(self.path, hash), "rb") as f:
+            while block := await f.read(block_size):
+                yield block
+
+    async def write_chunk_from(self, blocks, hash, length=None):
+        # 先写临时文件再改名，中途失败不会留下不完整的分块
+        path = os.path.join(self.path, hash)
+        tmp = f"{path}.{secrets.token_hex(4)}.tmp"
+        try:
+            async with aiofiles.open(tmp, "wb") as f:
+                async for block in iter_blocks(blocks):
+                    await f.write(block)
+            await aiofiles.os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return True
+
+    async def ping(self):
+        if not os.path.isdir(self.path) or not os.access(self.path, os.W_OK):
+            raise OSError(f"Storage path {self.path} is not a writable directory")
+
     async def delete_chunk(self, hash):
         try:
             os.remove(os.path.join(self.path, hash))
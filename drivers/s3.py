@@ -1,13 +1,34 @@
-from drivers import Driver
+from drivers import BLOCK_SIZE, Driver, iter_blocks
 import aiohttp
 import os
 import io
 import miniopy_async
 
 
+class _BlockReader:
+    """把块序列包装成 miniopy_async 需要的 read(size) 接口，每次返回不超过 size 字节"""
+
+    def __init__(self, blocks):
+        self._blocks = iter_blocks(blocks)
+        self._pending = memoryview(b"")
+
+    async def read(self, size: int = -1) -> bytes:
+        if not self._pending:
+            try:
+                self._pending = memoryview(await self._blocks.__anext__())
+            except StopAsyncIteration:
+                return b""
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data  # type: ignore
+
+
 class S3Driver(Driver):
     name = "s3"
     name_human = "S3"
+    streaming = True
+    part_size = 16 * 1024 * 1024  # 超过此大小的分块使用分片上传，也是流式写入的内存上限
 
     setting_define = [
         {
@@ -51,6 +72,21 @@ class S3Driver(Driver):
         )
         self.bucket_name = self.setting["bucket_name"]
         self.root = self.setting["root"]
+        self.part_size = max(
+            5 * 1024 * 1024, int(self.setting.get("part_size") or self.part_size)
+        )
+        self.http: aiohttp.ClientSession | None = None
+
+    async def connect(self):
+        self.http = aiohttp.ClientSession()
+
+    async def close(self):
+        if self.http:
+            await self.http.close()
+
+    async def ping(self):
+        if not await self.session.bucket_exists(self.bucket_name):
+            raise OSError(f"Bucket {self.bucket_name} does not exist")
 
     async def add_chunk(self, data: bytes, hash: str):
         # 上传文件到S3
@@ -64,9 +100,41 @@ class S3Driver(Driver):
     async def get_chunk(self, hash):
         # 从S3下载文件
         key = os.path.join(self.root, hash)
-        async with aiohttp.ClientSession() as session:
-            response = await self.session.get_object(self.bucket_name, key, session)
+        response = await self.session.get_object(self.bucket_name, key, self.http)
+        try:
             return await response.read()
+        finally:
+            response.release()
+
+    async def get_chunk_range(self, hash, offset, length):
+        key = os.path.join(self.root, hash)
+        response = await self.session.get_object(
+            self.bucket_name, key, self.http, offset=offset, length=length
+        )
+        try:
+            return await response.read()
+        finally:
+            response.release()
+
+    async def open_chunk_reader(self, hash, block_size=BLOCK_SIZE):
+        key = os.path.join(self.root, hash)
+        response = await self.session.get_object(self.bucket_name, key, self.http)
+        try:
+            async for block in response.content.iter_chunked(block_size):
+                yield block
+        finally:
+            response.release()
+
+    async def write_chunk_from(self, blocks, hash, length=None):
+        key = os.path.join(self.root, hash)
+        await self.session.put_object(
+            bucket_name=self.bucket_name,
+            object_name=key,
+            data=_BlockReader(blocks),
+            length=-1 if length is None else length,
+            part_size=self.part_size,
+        )
+        return True
 
     async def delete_chunk(self, hash):
         # 删除S3中的文件
@@ -1,12 +1,15 @@
-from drivers import Driver
+from drivers import BLOCK_SIZE, Driver, iter_blocks
 import os
 import aiowebdav.client
+import aiowebdav.exceptions
+from aiowebdav.urn import Urn
 import io
 
 
 class WebdavDriver(Driver):
     name = "webdav"
     name_human = "Webdav存储"
+    streaming = True
 
     setting_define = [
         {
@@ -45,6 +48,13 @@ class WebdavDriver(Driver):
             }
         )
 
+    async def close(self):
+        await self.client.close()
+
+    async def ping(self):
+        if not await self.client.check(self.setting["root"]):
+            raise OSError(f"WebDAV root {self.setting['root']} is not reachable")
+
     async def add_chunk(self, data, hash):
         byte_io = io.BytesIO(data)
         await self.client.upload_to(
@@ -53,13 +63,53 @@ class WebdavDriver(Driver):
         )
         return True
 
+    async def _download(self, hash, headers=None):
+        # 直接发送 GET，省去 download_from 事先的 is_dir 和 check 两次请求
+        path = Urn(os.path.join(self.setting["root"], hash)).quote()
+        try:
+            return await self.client.execute_request(
+                action="download", path=path, headers_ext=headers
+            )
+        except aiowebdav.exceptions.RemoteResourceNotFound:
+            raise FileNotFoundError(hash)
+
     async def get_chunk(self, hash):
-        byte_io = io.BytesIO()
-        await self.client.download_from(
-            byte_io,
-            os.path.join(self.setting["root"], hash),
+        response = await self._download(hash)
+        try:
+            return await response.read()
+        finally:
+            response.release()
+
+    async def get_chunk_range(self, hash, offset, length):
+        response = await self._download(
+            hash, [f"Range: bytes={offset}-{offset + length - 1}"]
         )
-        return byte_io.getvalue()
+        try:
+            data = await response.read()
+        finally:
+            response.release()
+        if response.status != 206:  # 服务端忽略了 Range，返回的是整个对象
+            data = data[offset : offset + length]
+        return data
+
+    async def open_chunk_reader(self, hash, block_size=BLOCK_SIZE):
+        response = await self._download(hash)
+        try:
+            async for block in response.content.iter_chunked(block_size):
+                yield block
+        finally:
+            response.release()
+
+    async def write_chunk_from(self, blocks, hash, length=None):
+        path = Urn(os.path.join(self.setting["root"], hash)).quote()
+        response = await self.client.execute_request(
+            action="upload",
+            path=path,
+            data=iter_blocks(blocks),
+            headers_ext=None if length is None else [f"Content-Length: {length}"],
+        )
+        response.release()
+        return True
 
     async def delete_chunk(self, hash):
         await self.client.clean(os.path.join(self.setting["root"], hash))
@@ -1,6 +1,10 @@
 import click
 import multiprocessing
 import hashlib
+import os
+import secrets
+
+UPLOAD_BLOCK = 1024 * 1024  # 上传时每次读取的字节数
 
 
 @click.group()
@@ -34,5 +38,122 @@ def set_admin_password(password):
     asyncio.run(db.Tortoise.close_connections())
 
 
+def _collect_files(paths):
+    """展开待上传的文件：目录按相对路径（包含目录名本身）上传"""
+    for path in paths:
+        if os.path.isdir(path):
+            base = os.path.dirname(os.path.abspath(path))
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    local = os.path.join(root, name)
+                    remote = os.path.relpath(os.path.abspath(local), base)
+                    yield local, remote.replace(os.sep, "/")
+        else:
+            yield path, os.path.basename(path)
+
+
+def _multipart(files, boundary: str):
+    """边读取边生成 multipart/form-data 请求体，不把文件读入内存"""
+    for local, remote in files:
+        name = remote.replace("\\", "\\\\").replace('"', '\\"')
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="{name}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        with open(local, "rb") as f:
+            while block := f.read(UPLOAD_BLOCK):
+                yield block
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+def _request(server: str, method: str, path: str, body=None, headers=None):
+    import http.client
+    import json
+    from urllib.parse import urlsplit
+
+    url = urlsplit(server)
+    connection = (
+        http.client.HTTPSConnection
+        if url.scheme == "https"
+        else http.client.HTTPConnection
+    )(url.netloc, timeout=3600)
+    try:
+        connection.request(
+            method,
+            url.path.rstrip("/") + path,
+            body=body,
+            headers=headers or {},
+            encode_chunked=body is not None and not isinstance(body, (str, bytes)),
+        )
+        response = connection.getresponse()
+        data = json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+    if response.status != 200:
+        detail = (
+            data.get("msg") or data.get("detail") if isinstance(data, dict) else data
+        )
+        raise click.ClickException(
+            f"{method} {path} failed ({response.status}): {detail}"
+        )
+    return data
+
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--server", default="http://127.0.0.1:23901", help="Server URL")
+@click.option("--username", default="admin", help="Username")
+@click.option(
+    "--password",
+    prompt=True,
+    hide_input=True,
+    envvar="KIANAFS_PASSWORD",
+    help="Password, or set KIANAFS_PASSWORD",
+)
+@click.option("--prefix", default="", help="Remote directory to upload into")
+@click.option("--batch-size", default=500, type=int, help="Files per request")
+def upload(paths, server, username, password, prefix, batch_size):
+    """Upload files and directories, many files per request"""
+    import json
+    from urllib.parse import urlencode
+
+    token = _request(
+        server,
+        "POST",
+        "/api/user/login",
+        json.dumps({"username": username, "password": password}),
+        {"Content-Type": "application/json"},
+    )["data"]
+
+    files = list(_collect_files(paths))
+    failed = 0
+    for i in range(0, len(files), max(1, batch_size)):
+        batch = files[i : i + max(1, batch_size)]
+        boundary = secrets.token_hex(16)
+        results = _request(
+            server,
+            "POST",
+            "/api/file/upload/batch?" + urlencode({"prefix": prefix}),
+            _multipart(batch, boundary),
+            {
+                "X-Authorization": token,
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+            },
+        )["data"]
+        for result in results:
+            if result["success"]:
+                click.echo(f"uploaded {result['filename']} {result['hash']}")
+            else:
+                failed += 1
+                click.echo(
+                    f"failed   {result['filename']}: {result['error']}", err=True
+                )
+    click.echo(f"{len(files) - failed} uploaded, {failed} failed")
+    if failed:
+        raise SystemExit(1)
+
+
 if __name__ == "__main__":
     cli()
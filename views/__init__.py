@@ -1,6 +1,12 @@
 import db
 import drivers
-import random
+import core.auth
+import core.cache
+import core.compression
+import core.disk_cache
+import core.erasure
+import core.executor
+import core.scheduler
 from fastapi.exceptions import HTTPException
 from fastapi import Depends, Header, Response as FastapiResponse
 import jwt
@@ -30,54 +36,63 @@ class Response(FastapiResponse):
 
 
 async def get_chunk(hash: str):
+    return await core.cache.chunks.get(hash, lambda: _fetch_chunk(hash))
+
+
+async def _fetch_chunk(hash: str):
     chunk = await db.Chunk.get_or_none(hash=hash)
     if not chunk:
         raise HTTPException(status_code=404, detail="Chunk not found")
 
-    await chunk.fetch_related("storages")
-    if not chunk.storages:
+    shards: list[db.Shard] = []
+    if chunk.ec_data:
+        shards = await db.Shard.filter(chunk=chunk).select_related("storage")
+        storages: list[db.Storage] = [shard.storage for shard in shards]
+    elif chunk.pack_id is not None:  # type: ignore
+        storages = await db.Storage.filter(packs__id=chunk.pack_id)  # type: ignore
+    else:
+        await chunk.fetch_related("storages")
+        storages = list(chunk.storages)  # 确保 storages 是一个列表
+    if not storages:
         raise HTTPException(status_code=404, detail="Chunk's storage not found")
-    storages: list[db.Storage] = list(chunk.storages)  # 确保 storages 是一个列表
-    random.shuffle(storages)  # type: ignore
-    for storage in storages:
-        try:
-            driver = await drivers.get_storage(storage.driver, storage.driver_settings)
-            chunk_data = await driver.get_chunk(chunk.hash)
-            return chunk_data
-        except Exception as e:
-            continue
-    raise HTTPException(status_code=404, detail="Chunk's storage not found")
-
-
-async def add_chunk(fp, hash: str, storage_list, num_storages):
-    priorities = [item.priority for item in storage_list]
-
-    success_count = 0
-    attempts = 0
-    max_attempts = num_storages * 2  # 避免无限循环
+    remote = any(drivers.drivers[storage.driver].remote for storage in storages)
 
-    # 持续尝试直到满足成功数量或超出尝试次数
-    while success_count < num_storages and attempts < max_attempts:
-        # 每次随机选择一个存储（允许重复）
-        storage = random.choices(storage_list, weights=priorities, k=1)[0]
-        driver = await drivers.get_storage(storage.driver, storage.driver_settings)
+    # 远程存储读取过的分块可能已在本地磁盘缓存中
+    if core.disk_cache.chunks is not None and remote:
+        chunk_data = await core.disk_cache.chunks.get(chunk.hash)
+        if chunk_data is not None:
+            return chunk_data
 
+    if chunk.ec_data:
         try:
-            await driver.add_chunk(data=fp, hash=hash)
-            success_count += 1
-        except Exception as e:
-            pass  # 失败时静默继续
-
-        attempts += 1
+            chunk_data = await core.erasure.read(chunk, shards)
+        except core.erasure.ErasureError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        if remote and core.disk_cache.chunks is not None:
+            core.disk_cache.chunks.put(chunk.hash, chunk_data)
+        return chunk_data
+
+    async def fetch(storage: db.Storage):
+        async with drivers.registry.use(storage) as driver:
+            if chunk.pack_id is not None:  # type: ignore
+                # 从打包对象中按范围读取
+                data = await driver.get_chunk_range(
+                    chunk.pack_id, chunk.pack_offset, chunk.stored_size  # type: ignore
+                )
+                return data, driver.remote
+            return await driver.get_chunk(chunk.hash), driver.remote
 
-    # 最终校验成功数量
-    if success_count >= num_storages:
-        return
-    else:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to upload to {num_storages} storages. Succeeded: {success_count}",
+    try:
+        chunk_data, from_remote = await core.scheduler.reads.read(storages, fetch)
+    except Exception:
+        raise HTTPException(status_code=404, detail="Chunk's storage not found")
+    if chunk.codec != core.compression.NONE:
+        chunk_data = await core.executor.cpu.run(
+            core.compression.decompress, chunk.codec, chunk_data
         )
+    if from_remote and core.disk_cache.chunks is not None:
+        core.disk_cache.chunks.put(chunk.hash, chunk_data)
+    return chunk_data
 
 
 def login():
@@ -86,28 +101,22 @@ def login():
             raise HTTPException(status_code=401, detail="Token is missing")
 
         try:
-            # 解码并验证 Token
-            secret_key = await db.get_cfg("secret_key", "114514")  # type: ignore
-            payload = jwt.decode(token, secret_key, algorithms=["HS256"])
-
-            # 校验 payload 是否包含必要字段
-            if "username" not in payload:
-                raise HTTPException(status_code=401, detail="Invalid token payload")
-
-            # 验证用户是否存在
-            user = await db.User.get_or_none(username=payload["username"])
-            if not user:
-                raise HTTPException(status_code=401, detail="User not found")
-            elif not user.has_permission("w"):
-                raise HTTPException(
-                    status_code=403, detail="User does not have permission"
-                )
-
+            # 解码并验证 Token，结果按 token 缓存
+            user = await core.auth.cache.authenticate(token)
         except jwt.exceptions.ExpiredSignatureError:
             raise HTTPException(status_code=401, detail="Token expired")
         except jwt.exceptions.DecodeError:
             raise HTTPException(status_code=401, detail="Invalid token format")
+        except jwt.exceptions.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token payload")
         except Exception as e:
             raise HTTPException(status_code=500, detail="Internal server error")
 
+        # 验证用户是否存在
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        elif not user.has_permission("w"):
+            raise HTTPException(status_code=403, detail="User does not have permission")
+        return user
+
     return Depends(wrapper)
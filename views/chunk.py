@@ -1,41 +1,179 @@
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response, StreamingResponse
 import db
 import views
+import core.cache
+import core.gc
+import core.disk_cache
+import core.erasure
+import core.executor
+import core.pack
+import core.pagination
 
 router = APIRouter(prefix="/api/chunk")
 
 
-@router.get("/metadata/<hash>")
+@router.get("/metadata/{hash}")
 async def get_chunk_metadata(hash: str):
     chunk = await db.Chunk.get_or_none(hash=hash)
     if not chunk:
         raise HTTPException(status_code=404, detail="Chunk not found")
-    await chunk.fetch_related("storages")
+    await chunk.fetch_related("storages", "shards__storage", "pack__storages")
     return views.Response(
         {
             "hash": chunk.hash,
             "size": chunk.size,
-            "storage": [s.name for s in chunk.storages],
+            "codec": chunk.codec,
+            "stored_size": chunk.stored_size,
+            "storage": [
+                s.name for s in (chunk.pack.storages if chunk.pack else chunk.storages)
+            ],
+            "pack": (
+                {"id": chunk.pack.id, "offset": chunk.pack_offset}
+                if chunk.pack
+                else None
+            ),
+            "erasure": (
+                {
+                    "data_shards": chunk.ec_data,
+                    "parity_shards": chunk.ec_parity,
+                    "shards": {
+                        shard.index: shard.storage.name for shard in chunk.shards
+                    },
+                }
+                if chunk.ec_data
+                else None
+            ),
         }
     )
 
 
+CHUNK_FIELDS = [
+    "hash",
+    "size",
+    "codec",
+    "stored_size",
+    "ec_data",
+    "refcount",
+    "pack_id",
+]
+
+
+async def chunk_rows(rows: list) -> list:
+    """为 CHUNK_FIELDS 投影的查询结果补充存储节点名称，整页只查询一次"""
+    storages = {row["hash"]: [] for row in rows}
+    pairs = await db.Chunk.filter(
+        hash__in=list(storages), storages__name__not_isnull=True
+    ).values_list("hash", "storages__name")
+    for chunk_hash, name in pairs:
+        storages[chunk_hash].append(name)
+    # 打包的分块保存在所在打包对象的存储节点上
+    packs = {row["pack_id"]: [] for row in rows if row["pack_id"] is not None}
+    if packs:
+        pairs = await db.Pack.filter(
+            id__in=list(packs), storages__name__not_isnull=True
+        ).values_list("id", "storages__name")
+        for pack_id, name in pairs:
+            packs[pack_id].append(name)
+    for row in rows:
+        row["storage"] = (
+            packs[row["pack_id"]]
+            if row["pack_id"] is not None
+            else storages[row["hash"]]
+        )
+    return rows
+
+
 @router.get("/list")
-async def list_chunk(page: int = 1, page_size: int = 10):
-    offset = (page - 1) * page_size
-    chunks = await db.Chunk.all().offset(offset).limit(page_size)
+async def list_chunk(
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    page: Optional[int] = None,
+    page_size: int = 10,
+):
+    """
+    按哈希顺序分页列出所有分块。
+
+    :param cursor: 上一页响应中的 next，为空表示第一页
+    :param page: 已弃用，传入时按旧的 page/page_size 分页并返回旧格式的列表，下个版本移除
+    """
+    if page is not None:
+        rows = await core.pagination.offset_page(
+            db.Chunk.all(), "hash", CHUNK_FIELDS, page, page_size
+        )
+        return views.Response(await chunk_rows(rows))
+    try:
+        rows, next_cursor = await core.pagination.page(
+            db.Chunk.all(), "hash", CHUNK_FIELDS, cursor, limit
+        )
+    except core.pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return views.Response({"chunks": await chunk_rows(rows), "next": next_cursor})
+
+
+@router.get("/export")
+async def export_chunk():
+    """以 NDJSON 流的形式导出所有分块，每行一个分块"""
+
+    async def generate():
+        async for rows in core.pagination.scan(db.Chunk.all(), "hash", CHUNK_FIELDS):
+            yield core.pagination.ndjson(await chunk_rows(rows))
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/cache")
+async def cache_stats():
+    disk = core.disk_cache.chunks
+    return views.Response(
+        {
+            "memory": core.cache.chunks.stats(),
+            "disk": await disk.stats() if disk is not None else None,
+        }
+    )
+
+
+@router.get("/executor")
+async def executor_stats():
+    return views.Response(core.executor.cpu.stats())
+
+
+@router.get("/gc")
+async def gc_stats():
+    return views.Response(core.gc.collector.stats())
+
+
+@router.post("/gc")
+async def run_gc(_=views.login()):
+    collected = await core.gc.collector.run_once()
+    return views.Response({"collected": collected, **core.gc.collector.stats()})
+
+
+@router.post("/compact")
+async def compact_packs(_=views.login()):
+    compacted, moved = await core.pack.compact()
     return views.Response(
-        [
-            {
-                "hash": chunk.hash,
-                "size": chunk.size,
-                "storage": [s.name for s in chunk.storages],
-            }
-            for chunk in chunks
-        ]
+        {"compacted": compacted, "moved": moved, **core.pack.packer.stats()}
     )
 
 
-@router.get("/download/<hash>")
+@router.post("/repair")
+async def repair_degraded(limit: int = 1000, _=views.login()):
+    checked, written = await core.erasure.repair_degraded(limit)
+    return views.Response({"checked": checked, "written": written})
+
+
+@router.post("/repair/{hash}")
+async def repair_chunk(hash: str, _=views.login()):
+    try:
+        written = await core.erasure.repair(hash)
+    except core.erasure.ErasureError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return views.Response({"written": written})
+
+
+@router.get("/download/{hash}")
 async def download(hash: str):
-    return await views.get_chunk(hash)
+    return Response(await views.get_chunk(hash), media_type="application/octet-stream")
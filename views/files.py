@@ -1,78 +1,158 @@
 import views
-from fastapi import APIRouter, UploadFile, HTTPException, Request, Header, Depends
+import core.compression
+import core.erasure
+import core.gc
+import core.ingest
+import core.manifest
+import core.namespace
+import core.pagination
+import core.sendfile
+import core.stream
+from fastapi import APIRouter, UploadFile, HTTPException, Request, Header
 from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from tortoise.transactions import in_transaction
 import db
-import drivers
-import hashlib
-import aiofiles
+import secrets
 import xxhash
-from typing import Optional, Annotated
+from datetime import timezone
+from email.utils import format_datetime
+from typing import AsyncIterator, Dict, List, Optional, Annotated, Tuple
 from urllib.parse import quote
 
 router = APIRouter(prefix="/api/file")
 
+BATCH_MAX_FILES = 10000  # 批量上传单个请求的最大文件数
 
-async def upload_file(file, filename: str):
-    # 检查文件是否已存在
-    if await db.File.exists(filename=filename):
-        raise HTTPException(status_code=400, detail="File already exists")
+_NAMESPACE_STATUS = {
+    core.namespace.PathNotFound: 404,
+    core.namespace.PathExists: 409,
+    core.namespace.DirectoryNotEmpty: 409,
+    core.namespace.InvalidPath: 400,
+}
 
-    # 获取可用的存储节点列表
-    storage_list = await db.Storage.filter(enabled=True).all()
-    if not storage_list:
-        raise HTTPException(status_code=500, detail="No available storage")
 
-    # 创建 File 实例但不保存到数据库
-    file_db = db.File(filename=filename)
+def namespace_error(e: core.namespace.NamespaceError) -> HTTPException:
+    return HTTPException(status_code=_NAMESPACE_STATUS.get(type(e), 400), detail=str(e))
 
-    # 获取分块大小配置
-    chunk_size: int = await db.get_cfg("chunk_size", 1024 * 1024)
-    chunks = []
-    total_size = 0
-    num_storages = await db.get_cfg("num_storages", 3)
-    while chunk := await file.read(chunk_size):
-        total_size += len(chunk)
-        chunk_hash = xxhash.xxh3_128_hexdigest(chunk)
-        chunks.append(chunk_hash)
 
-        # 如果分块已存在，则跳过存储
-        if await db.Chunk.exists(hash=chunk_hash):
-            continue
+def split_path(path: str):
+    try:
+        return core.namespace.split(path)
+    except core.namespace.NamespaceError as e:
+        raise namespace_error(e)
 
-        # 将分块存储到多个驱动
-        try:
-            await views.add_chunk(
-                fp=chunk,
-                hash=chunk_hash,
-                storage_list=storage_list,
-                num_storages=num_storages,
-            )
-        except HTTPException as e:
-            raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-        # 创建 Chunk 实例并保存到数据库
-        chunk_instance = await db.Chunk.create(hash=chunk_hash, size=len(chunk) / 1024)
+async def get_file(key: str, path: bool) -> db.File:
+    """按哈希或完整路径查找文件，不存在时返回 404"""
+    if path:
+        split_path(key)
+        file = await core.namespace.lookup_file(key)
+    else:
+        key = key.split("/")[0]
+        file = await db.File.get_or_none(hash=key)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+    return file
+
 
-        # 将 Chunk 与 Storage 关联
-        for storage in storage_list:
-            await chunk_instance.storages.add(storage)
+async def new_ingest() -> core.ingest.ChunkIngest:
+    """按部署配置创建分块写入流水线，批量上传的所有文件共用一个"""
+    # 获取可用的存储节点列表
+    storage_list = await db.Storage.filter(enabled=True).all()
+    if not storage_list:
+        raise HTTPException(status_code=500, detail="No available storage")
+    return core.ingest.ChunkIngest(
+        storage_list,
+        num_storages=await db.get_cfg("num_storages", 3),
+        quorum=await db.get_cfg("write_quorum"),
+        concurrency=await db.get_cfg("upload_concurrency", 4),
+        batch_size=await db.get_cfg("dedup_batch", 64),
+        codec=await core.erasure.get_codec(),
+        compressor=await core.compression.get_compressor(),
+        pack_threshold=await db.get_cfg("pack_threshold", 0),
+    )
 
-        # 将 Chunk 与 File 关联
-        await file_db.chunks.add(chunk_instance)
 
-    # 计算文件哈希值并设置文件大小
-    file_hash = xxhash.xxh3_128_hexdigest(str(chunks).encode())
-    file_db.hash = file_hash
-    file_db.size = total_size / 1024  # 文件大小以 KB 为单位
+def content_hash(chunks: List[str]) -> str:
+    return xxhash.xxh3_128_hexdigest(str(chunks).encode())
 
-    # 保存文件信息到数据库
+
+async def save_files(
+    ingest: core.ingest.ChunkIngest,
+    entries: List[Tuple[List[str], str, List[str], List[int]]],
+):
+    """
+    在一个事务中保存分块、文件、分块清单，并更新目录汇总。
+
+    :param entries: (路径分量, 文件哈希, 分块哈希, 分块大小) 列表
+    """
+    refs: Dict[str, int] = {}  # 每个分块被多少个文件引用
+    for _, _, chunks, _ in entries:
+        for chunk_hash in set(chunks):
+            refs[chunk_hash] = refs.get(chunk_hash, 0) + 1
     try:
-        await file_db.save()
-        return file_hash
+        async with in_transaction() as conn:
+            await ingest.commit(using_db=conn, refs=refs)
+            dirs: Dict[Tuple[str, ...], int] = {}
+            totals: Dict[int, List[float]] = {}  # 目录 ID -> [文件数, 总大小]
+            files, manifests = [], []
+            for parts, file_hash, chunks, sizes in entries:
+                key = tuple(parts[:-1])
+                if key not in dirs:
+                    dirs[key] = await core.namespace.mkdirs(parts[:-1], using_db=conn)
+                size = sum(sizes) / 1024  # 文件大小以 KB 为单位
+                files.append(
+                    db.File(
+                        hash=file_hash,
+                        directory_id=dirs[key],
+                        name=parts[-1],
+                        size=size,
+                    )
+                )
+                manifests.append(
+                    (file_hash, core.manifest.Manifest.build(chunks, sizes))
+                )
+                total = totals.setdefault(dirs[key], [0, 0.0])
+                total[0] += 1
+                total[1] += size
+            await db.File.bulk_create(files, using_db=conn)
+            await core.manifest.save_many(manifests, using_db=conn)
+            for dir_id, (count, size) in totals.items():
+                await core.namespace.adjust(
+                    dir_id, files=int(count), size=size, using_db=conn
+                )
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to save file info to database: {str(e)}"
         )
+    ingest.link_stragglers()
+
+
+async def upload_file(blocks: AsyncIterator[bytes], filename: str):
+    """
+    写入文件。
+
+    :param blocks: 任意大小的文件数据块，按配置的分块方式重新切分后写入
+    :param filename: 文件的完整路径，上级目录不存在时自动创建
+    """
+    parts = split_path(filename)
+    if not parts:
+        raise HTTPException(status_code=400, detail="Filename is required")
+    # 检查文件是否已存在
+    if await core.namespace.lookup_file(filename) is not None:
+        raise HTTPException(status_code=400, detail="File already exists")
+
+    ingest = await new_ingest()
+    try:
+        chunks, sizes = await ingest.run(await core.ingest.split_chunks(blocks))
+        file_hash = content_hash(chunks)
+        await save_files(ingest, [(parts, file_hash, chunks, sizes)])
+    except BaseException:
+        # 清理已写入但不会被提交的分块
+        await ingest.abort()
+        raise
+    return file_hash
 
 
 @router.post("/upload")
@@ -88,7 +168,7 @@ async def upload(
 
     # 调用 upload_file 函数
     try:
-        file_hash = await upload_file(file, filename)
+        file_hash = await upload_file(core.ingest.read_blocks(file), filename)
         return {"message": "File uploaded successfully", "hash": file_hash}
     except HTTPException as e:
         raise HTTPException(status_code=e.status_code, detail=e.detail)
@@ -103,143 +183,413 @@ async def upload_stream(
     file_name = x_filename
     if not file_name:
         raise HTTPException(status_code=400, detail="Filename is required")
-    async with aiofiles.tempfile.SpooledTemporaryFile(
-        max_size=15 * 1024 * 1024
-    ) as temp_file:
-        async for chunk in request.stream():
-            await temp_file.write(chunk)
-        await temp_file.seek(0)
+    # 请求体边接收边切分写入，不落盘
+    try:
+        file_hash = await upload_file(request.stream(), file_name)
+        return {"message": "File uploaded successfully", "hash": file_hash}
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+@router.post("/upload/batch")
+async def upload_batch(request: Request, prefix: str = "", _=views.login()):
+    """
+    批量上传多个文件。
+
+    请求体为 multipart/form-data，每个名为 files 的部分是一个文件，部分的文件名即文件路径
+    （可以包含目录），写入 prefix 目录下。所有文件共用存储节点列表、部署配置和去重窗口，
+    元数据在一个事务中写入。路径无效、已存在或内容与其他文件相同的文件会被跳过。
+
+    :return: 按上传顺序排列的每个文件的结果
+    """
+    form = await request.form(max_files=BATCH_MAX_FILES, max_fields=BATCH_MAX_FILES)
+    ingest = None
+    try:
+        ingest = await new_ingest()
+        results: List[dict] = []
+        accepted = []
+        paths: set[str] = set()
+        for upload in form.getlist("files"):
+            if isinstance(upload, str):
+                continue
+            result: dict = {
+                "filename": core.namespace.join(prefix, upload.filename or "")
+            }
+            results.append(result)
+            try:
+                parts = core.namespace.split(result["filename"])
+            except core.namespace.NamespaceError as e:
+                result["error"] = str(e)
+                continue
+            path = "/".join(parts)
+            if not parts:
+                result["error"] = "Filename is required"
+                continue
+            if path in paths or await core.namespace.lookup_file(path) is not None:
+                result["error"] = "File already exists"
+                continue
+            paths.add(path)
+            result["filename"] = path
+
+            chunks, sizes = await ingest.feed(
+                await core.ingest.split_chunks(core.ingest.read_blocks(upload))
+            )
+            result["hash"] = content_hash(chunks)
+            result["size"] = sum(sizes) / 1024  # 文件大小以 KB 为单位
+            accepted.append((result, parts, chunks, sizes))
+        await ingest.finish()
+
+        # 文件以内容哈希为主键，内容相同的文件只能保存一份
+        existing = set(
+            await db.File.filter(
+                hash__in=[result["hash"] for result, *_ in accepted]
+            ).values_list("hash", flat=True)
+        )
+        entries = []
+        for result, parts, chunks, sizes in accepted:
+            if result["hash"] in existing:
+                result["error"] = "File with the same content already exists"
+                continue
+            existing.add(result["hash"])
+            entries.append((parts, result["hash"], chunks, sizes))
+        if entries:
+            await save_files(ingest, entries)
+        else:
+            await ingest.abort()  # 没有需要保存的文件
+    except BaseException:
+        if ingest is not None:
+            await ingest.abort()
+        raise
+    finally:
+        await form.close()
+
+    for result in results:
+        result["success"] = "error" not in result
+    return views.Response(results)
+
+
+def parse_range(header: Optional[str], size: int):
+    """
+    解析 Range 请求头。
+
+    :return: None 表示忽略 Range（返回完整内容），空列表表示范围无法满足，
+             否则为闭区间 (start, end) 列表
+    """
+    if not header or size == 0:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    for item in spec.split(","):
+        first, sep, last = item.strip().partition("-")
+        if not sep:
+            return None
         try:
-            file_hash = await upload_file(temp_file, file_name)
-            return {"message": "File uploaded successfully", "hash": file_hash}
-        except HTTPException as e:
-            raise HTTPException(status_code=e.status_code, detail=e.detail)
+            if not first:  # 后缀范围：最后 N 个字节
+                length = int(last)
+                if length <= 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            start = int(first)
+            end = int(last) if last else size - 1
+        except ValueError:
+            return None
+        if last and start > end:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+def _if_range_matches(if_range: Optional[str], etag: str, last_modified: str):
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag  # If-Range 只允许强校验
+    return if_range == last_modified
 
 
 @router.get("/download/{key:path}")
 async def download(
     key: str,
+    request: Request,
     path: bool = False,
 ):
-    if path:
-        file = await db.File.get_or_none(filename=key)
-    else:
-        key = key.split("/")[0]
-        file = await db.File.get_or_none(hash=key)
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
+    file = await get_file(key, path)
+
+    manifest = await core.manifest.load(file)
+    size = manifest.size
+    # 预取窗口：同时在途的分块数量，内存上限为 window * chunk_size
+    window = int(await db.get_cfg("download_window", 8))
+
+    update_time = file.update_time
+    if update_time.tzinfo is None:
+        update_time = update_time.replace(tzinfo=timezone.utc)
+    etag = f'"{file.hash}"'
+    last_modified = format_datetime(update_time.astimezone(timezone.utc), usegmt=True)
+    headers = {
+        "Content-Disposition": f"attachment; filename={quote(file.name)}",
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": last_modified,
+    }
+
+    ranges = None
+    if _if_range_matches(request.headers.get("if-range"), etag, last_modified):
+        ranges = parse_range(request.headers.get("range"), size)
+
+    if ranges == []:
+        response = views.Response(msg="Range Not Satisfiable", code=416)
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+
+    async def fetch_part(part):
+        chunk_hash, lo, hi = part
+        data = await views.get_chunk(chunk_hash)
+        if lo == 0 and hi == len(data):
+            return data
+        return data[lo:hi]
+
+    def stream_range(start: int, end: int):
+        return core.stream.read_ahead(manifest.span(start, end), fetch_part, window)
+
+    if ranges is None or len(ranges) == 1:
+        # 分块都在本地存储节点上时直接发送文件
+        start, end = ranges[0] if ranges else (0, size - 1)
+        segments = await core.sendfile.local_segments(manifest.span(start, end))
+        if segments is not None:
+            if ranges:
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return core.sendfile.SegmentFileResponse(
+                segments,
+                status_code=206 if ranges else 200,
+                headers=headers,
+                media_type="application/octet-stream",
+            )
+
+    if ranges is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            stream_range(0, size - 1),  # type: ignore
+            media_type="application/octet-stream",
+            headers=headers,
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Length"] = str(end - start + 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return StreamingResponse(
+            stream_range(start, end),  # type: ignore
+            status_code=206,
+            media_type="application/octet-stream",
+            headers=headers,
+        )
+
+    # 多段范围使用 multipart/byteranges
+    boundary = secrets.token_hex(16)
+    part_headers = [
+        (
+            f"--{boundary}\r\n"
+            "Content-Type: application/octet-stream\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode()
+    headers["Content-Length"] = str(
+        sum(
+            len(h) + end - start + 1 + 2
+            for h, (start, end) in zip(part_headers, ranges)
+        )
+        + len(closing)
+    )
 
-    async def response_data():
-        for chunk in file.chunks:
-            yield await views.get_chunk(chunk)
+    async def multipart_data():
+        for part_header, (start, end) in zip(part_headers, ranges):
+            yield part_header
+            async for data in stream_range(start, end):
+                yield data
+            yield b"\r\n"
+        yield closing
 
     return StreamingResponse(
-        response_data(),  # type: ignore
-        media_type="application/octet-stream",
-        headers={
-            "Content-Disposition": f"attachment; filename={quote(file.filename)}",
-            "Content-Length": str(int(file.size * 1024)),
-        },
+        multipart_data(),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
     )
 
 
+def file_info(file: db.File, path: str) -> dict:
+    return {
+        "hash": file.hash,
+        "filename": path,
+        "size": file.size,  # 文件大小以 KB 为单位
+    }
+
+
+def directory_info(directory: db.Directory, path: str) -> dict:
+    return {
+        "id": directory.id,
+        "path": path,
+        "file_count": directory.file_count,  # 子树中的文件数
+        "dir_count": directory.dir_count,  # 子树中的目录数
+        "size": directory.size,  # 子树中文件的总大小 (KB)
+    }
+
+
 @router.get("/metadata/{key:path}")
 async def file_metadata(key: str, path: bool = False):
+    file = await get_file(key, path)
     try:
-        if path:
-            file = await db.File.get_or_none(filename=key)
-        else:
-            key = key.split("/")[0]
-            file = await db.File.get_or_none(hash=key)
-        if not file:
-            raise HTTPException(status_code=404, detail="File not found")
-
-        return views.Response(
-            {
-                "hash": file.hash,
-                "filename": file.filename,
-                "size": file.size,  # 文件大小以 KB 为单位
-                "chunks": file.chunks,  # 存储分块哈希值列表
-            }
-        )
+        paths = await core.namespace.file_paths([file])
+        info = file_info(file, paths[file.hash])
+        info["chunks"] = (await core.manifest.load(file)).hashes()
+        return views.Response(info)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to get file metadata: {str(e)}"
         )
 
 
+FILE_FIELDS = ["hash", "directory_id", "name", "size"]
+
+
+async def file_rows(rows: list) -> list:
+    """把 FILE_FIELDS 投影的查询结果转换为接口返回的格式"""
+    dirs = await core.namespace.paths({row["directory_id"] for row in rows})
+    return [
+        {
+            "hash": row["hash"],
+            "filename": core.namespace.join(dirs[row["directory_id"]], row["name"]),
+            "size": row["size"],  # 文件大小以 KB 为单位
+        }
+        for row in rows
+    ]
+
+
 @router.get("/list")
-async def list_file(page: int = 1, page_size: int = 10):
+async def list_file(
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    page: Optional[int] = None,
+    page_size: int = 10,
+):
+    """
+    按哈希顺序分页列出所有文件。
+
+    :param cursor: 上一页响应中的 next，为空表示第一页
+    :param page: 已弃用，传入时按旧的 page/page_size 分页并返回旧格式的列表，下个版本移除
+    """
     try:
-        offset = (page - 1) * page_size
-        file_list = await db.File.all().offset(offset).limit(page_size)
-        return views.Response(
-            [
-                {
-                    "hash": file.hash,
-                    "filename": file.filename,
-                    "size": file.size,  # 文件大小以 KB 为单位
-                    "chunks": file.chunks,  # 存储分块哈希值列表
-                }
-                for file in file_list
-            ]
+        if page is not None:
+            rows = await core.pagination.offset_page(
+                db.File.all(), "hash", FILE_FIELDS, page, page_size
+            )
+            return views.Response(await file_rows(rows))
+        rows, next_cursor = await core.pagination.page(
+            db.File.all(), "hash", FILE_FIELDS, cursor, limit
         )
+        return views.Response({"files": await file_rows(rows), "next": next_cursor})
+    except core.pagination.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list file: {str(e)}")
 
 
+@router.get("/export")
+async def export_file():
+    """以 NDJSON 流的形式导出所有文件，每行一个文件"""
+
+    async def generate():
+        async for rows in core.pagination.scan(db.File.all(), "hash", FILE_FIELDS):
+            yield core.pagination.ndjson(await file_rows(rows))
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 @router.delete("/delete/{key:path}")
 async def delete_file(key: str, path: bool = False, _=views.login()):
-    if path:
-        file = await db.File.get_or_none(filename=key)
-    else:
-        key = key.split("/")[0]
-        file = await db.File.get_or_none(hash=key)
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
-
-    # 检查每个分块是否被其他文件使用
-    for chunk_hash in file.chunks:
-        chunk = await db.Chunk.get_or_none(hash=chunk_hash)
-        if not chunk:
-            continue
-        # 如果分块没有被其他文件使用，则删除分块及其存储
-        await chunk.fetch_related("storages")
-        for storage in chunk.storages:
-            driver = drivers.drivers[storage.driver](storage.driver_settings)  # type: ignore
-            try:
-                await driver.delete_chunk(chunk.hash)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to delete chunk from storage: {str(e)}",
-                )
-        await chunk.delete()
+    file = await get_file(key, path)
 
-    # 删除文件记录
-    await file.delete()
+    # 只删除元数据并减少分块引用计数，分块由后台垃圾回收删除
+    manifest = await core.manifest.load(file)
+    async with in_transaction() as conn:
+        if not await db.File.filter(hash=file.hash).using_db(conn).delete():
+            raise HTTPException(status_code=404, detail="File not found")
+        await db.FileManifest.filter(hash=file.hash).using_db(conn).delete()
+        await file.chunks.clear(using_db=conn)  # 升级前写入的旧关联
+        await core.gc.release(set(manifest.hashes()), using_db=conn)
+        await core.namespace.adjust(
+            file.directory_id, files=-1, size=-file.size, using_db=conn  # type: ignore
+        )
     return views.Response(msg="File deleted successfully")
 
 
-@router.get("/list/<path:path>")
-async def list_file_by_path(path: str):
-    if not path.endswith("/"):
-        path += "/"
+@router.get("/list/{path:path}")
+async def list_file_by_path(path: str, cursor: Optional[str] = None, limit: int = 100):
+    """
+    列出目录的直接子项：先列出子目录，再列出文件，各自按名称排序。
 
-    if path == "/":
-        path = ""
+    :param cursor: 上一页响应中的 next，为空表示第一页
+    """
+    parts = split_path(path)
+    directory = await core.namespace.lookup_dir(parts)
+    if directory is None:
+        raise HTTPException(status_code=404, detail="Directory not found")
     try:
-        file_list = await db.File.filter(filename__startswith=path)
-        return views.Response(
-            [
-                {
-                    "hash": file.hash,
-                    "filename": file.filename,
-                    "size": file.size,  # 文件大小以 KB 为单位
-                    "chunks": file.chunks,  # 存储分块哈希值列表
-                }
-                for file in file_list
-            ]
+        dirs, files, next_cursor = await core.namespace.list_dir(
+            directory.id, cursor, limit
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to list file: {str(e)}")
+    except core.namespace.NamespaceError as e:
+        raise namespace_error(e)
+    base = "/".join(parts)
+    return views.Response(
+        {
+            "directory": directory_info(directory, base),
+            "directories": [
+                directory_info(d, core.namespace.join(base, d.name)) for d in dirs
+            ],
+            "files": [
+                file_info(file, core.namespace.join(base, file.name)) for file in files
+            ],
+            "next": next_cursor,
+        }
+    )
+
+
+class MovePath(BaseModel):
+    src: str
+    dst: str
+
+
+@router.post("/mkdir/{path:path}")
+async def make_directory(path: str, _=views.login()):
+    parts = split_path(path)
+    async with in_transaction() as conn:
+        dir_id = await core.namespace.mkdirs(parts, using_db=conn)
+    directory = await db.Directory.get(id=dir_id)
+    return views.Response(directory_info(directory, "/".join(parts)))
+
+
+@router.post("/move")
+async def move_path(data: MovePath, _=views.login()):
+    """重命名或移动文件或目录，目录的移动与其中的文件数无关"""
+    try:
+        kind = await core.namespace.move(data.src, data.dst)
+    except core.namespace.NamespaceError as e:
+        raise namespace_error(e)
+    return views.Response({"type": kind}, msg="Moved successfully")
+
+
+@router.delete("/rmdir/{path:path}")
+async def remove_directory(path: str, _=views.login()):
+    try:
+        await core.namespace.rmdir(path)
+    except core.namespace.NamespaceError as e:
+        raise namespace_error(e)
+    return views.Response(msg="Directory deleted successfully")
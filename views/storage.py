@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, field_validator
 
+import core.health
+import core.scheduler
 import db
 import drivers
 import views
@@ -66,3 +68,27 @@ async def list_drivers():
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to list drivers")
+
+
+@router.get("/health")
+async def storage_health(_=views.login()):
+    """各存储节点的健康状态、探测延迟、读写错误计数和对冲读取统计"""
+    storage_list = await db.Storage.all()
+    reads = core.scheduler.reads.snapshot()
+    return views.Response(
+        {
+            "hedged": reads["hedged"],
+            "hedge_wins": reads["hedge_wins"],
+            "storages": core.health.monitor.snapshot(storage_list),
+        }
+    )
+
+
+@router.post("/health/{storage_id}")
+async def probe_storage(storage_id: int, _=views.login()):
+    """立即探测一个存储节点，探测成功的熔断节点会恢复读写"""
+    storage = await db.Storage.get_or_none(id=storage_id)
+    if storage is None:
+        raise HTTPException(status_code=404, detail="Storage not found")
+    await core.health.monitor.probe(storage, await db.get_cfg("health_timeout", 5))
+    return views.Response(core.health.monitor.snapshot([storage])[0])
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Body
 import db
 import views
+import core.auth
 import hashlib
 import jwt
 from pydantic import BaseModel
@@ -26,7 +27,7 @@ async def login(u: Login):
         password = u.password
 
     if user.password == password:
-        secret_key = await db.get_cfg("secret_key", "114514")
+        secret_key = await core.auth.cache.secret_key()
         token = jwt.encode({"username": u.username}, secret_key, algorithm="HS256")
         return views.Response(token)
     else:
@@ -47,13 +48,12 @@ async def register(username: str, password: str, raw: bool = True, _=views.login
 
 @router.get("/info")
 async def info(token: str):
-    secret_key = await db.get_cfg("secret_key", "114514")
     try:
-        payload = jwt.decode(token, secret_key, algorithms=["HS256"])
-        username = payload["username"]
-        user = await db.User.get_or_none(username=username)
-        if user is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return views.Response({"username": username, "permission": user.permission})
+        user = await core.auth.cache.authenticate(token)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return views.Response({"username": user.username, "permission": user.permission})